@@ -0,0 +1,115 @@
+import asyncio
+import functools
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+
+from quart import Quart, request, jsonify, Response, send_file, render_template
+
+from . import download_progress, progress_lock, tasks, handlers
+from .config import ASYNC_INFO_WORKERS, ASYNC_DOWNLOAD_WORKERS, ASYNC_CONTROL_WORKERS, ASYNC_FILE_CHUNK_SIZE
+
+# --- Async App Instance ---
+# Same routes as app/routes.py (both share app/handlers.py), but served on an asyncio
+# event loop so idle pollers and slow file readers cost a coroutine instead of an OS thread.
+asgi_app = Quart(__name__) # Shares templates/static folders with the Flask app
+
+# Blocking yt-dlp and FFmpeg work never runs on the event loop
+info_executor = ThreadPoolExecutor(max_workers=ASYNC_INFO_WORKERS, thread_name_prefix="InfoWorker")
+download_executor = ThreadPoolExecutor(max_workers=ASYNC_DOWNLOAD_WORKERS, thread_name_prefix="DownloadWorker")
+# Job bookkeeping touches the filesystem (disk_usage, rmtree of cancelled prefetches) and starts
+# threads; it gets its own small pool so it never queues behind slow info extractions
+control_executor = ThreadPoolExecutor(max_workers=ASYNC_CONTROL_WORKERS, thread_name_prefix="ControlWorker")
+
+tasks.start_cleanup_thread(download_progress, progress_lock)
+
+# --- Async Routes ---
+
+@asgi_app.route('/')
+async def index():
+    """Serves the main HTML page."""
+    return await render_template('index.html')
+
+@asgi_app.route('/fetch_video_info', methods=['POST'])
+async def fetch_video_info_route():
+    """API endpoint to fetch video information using yt-dlp."""
+    if not request.is_json:
+        return jsonify({'error': 'Request must be JSON'}), 415
+
+    url, error_response = handlers.parse_video_url(await request.get_json())
+    if error_response:
+        payload, status = error_response
+        return jsonify(payload), status
+
+    loop = asyncio.get_running_loop()
+    info, error = await loop.run_in_executor(info_executor, handlers.fetch_video_info, url)
+    payload, status = await loop.run_in_executor(control_executor, handlers.video_info_response, url, info, error) # May start a prefetch
+    return jsonify(payload), status
+
+
+@asgi_app.route('/start_download', methods=['POST'])
+async def start_download_route():
+    """API endpoint to queue a download on the download executor."""
+    if not request.is_json:
+        return jsonify({'error': 'Request must be JSON'}), 415
+
+    data = await request.get_json()
+    loop = asyncio.get_running_loop()
+    # Claiming/cancelling prefetches, storage admission and preemption all block
+    payload, status = await loop.run_in_executor(control_executor, functools.partial(handlers.start_download, data, executor=download_executor))
+    return jsonify(payload), status
+
+
+@asgi_app.route('/download_progress/<download_id>')
+async def get_download_progress_route(download_id):
+    """API endpoint to check the progress of a download."""
+    payload, status = handlers.progress_response(download_id)
+    return jsonify(payload), status
+
+
+@asgi_app.route('/download_file/<download_id>')
+async def download_file_route(download_id):
+    """API endpoint to stream the completed file with async file I/O."""
+    loop = asyncio.get_running_loop()
+    # Stats the file: slow storage must not stall the event loop
+    filepath, filename, error_message, status = await loop.run_in_executor(control_executor, handlers.locate_download_file, download_id)
+    if error_message:
+        return error_message, status
+
+    try:
+        # conditional=True honours Range requests so interrupted mobile clients can resume
+        response = await send_file(filepath, as_attachment=True, attachment_filename=filename, conditional=True)
+        response.response.buffer_size = ASYNC_FILE_CHUNK_SIZE # FileBody reads via aiofiles
+        return response
+    except Exception as e:
+        print(f"Error sending file {filename} for download ID {download_id}: {e}")
+        print(traceback.format_exc())
+        return "Server error: Could not send the file.", 500
+
+
+# --- Debug Routes (enabled by setting ADMIN_TOKEN) ---
+
+def _admin_token():
+    return request.headers.get('X-Admin-Token') # Header only: query strings end up in access logs and history
+
+@asgi_app.route('/debug/traces')
+async def debug_traces_route():
+    """Returns buffered tracing spans as JSON, or Chrome trace JSON with ?format=chrome."""
+    payload, status = handlers.debug_traces(_admin_token(), request.args)
+    return jsonify(payload), status
+
+@asgi_app.route('/debug/profile', methods=['GET', 'POST'])
+async def debug_profile_route():
+    """POST {"jobs": N} profiles the next N jobs; GET returns the merged profile (?format=pstats for a .prof file)."""
+    if request.method == 'POST':
+        payload, status = handlers.debug_arm_profile(_admin_token(), await request.get_json(silent=True))
+        return jsonify(payload), status
+    payload, status, is_dump = handlers.debug_profile(_admin_token(), request.args)
+    if is_dump:
+        return Response(payload, mimetype='application/octet-stream', headers={'Content-Disposition': 'attachment; filename=jobs.prof'})
+    return jsonify(payload), status
+
+@asgi_app.route('/debug/prefetch')
+async def debug_prefetch_route():
+    """Returns speculative prefetch counters and hit rate."""
+    payload, status = handlers.debug_prefetch(_admin_token())
+    return jsonify(payload), status
@@ -7,7 +7,17 @@ DOWNLOAD_FOLDER = 'downloads'
 
 # Base directory of the application
 BASE_DIR = os.path.abspath(os.path.dirname(__file__))
-DOWNLOAD_FOLDER_PATH = os.path.join(BASE_DIR, '..', DOWNLOAD_FOLDER) # Absolute path
+# Result tier: finished files served to users (override with RESULT_FOLDER)
+DOWNLOAD_FOLDER_PATH = os.environ.get('RESULT_FOLDER') or os.path.join(BASE_DIR, '..', DOWNLOAD_FOLDER) # Absolute path
+
+# Scratch tier: yt-dlp intermediates and merged sources before encoding.
+# Point SCRATCH_FOLDER at tmpfs or local NVMe; defaults to the result folder.
+SCRATCH_FOLDER_PATH = os.environ.get('SCRATCH_FOLDER') or DOWNLOAD_FOLDER_PATH
+
+# Free space reserved per admitted job on each tier; jobs are refused (HTTP 507)
+# when a tier cannot cover its reservation on top of already running jobs.
+JOB_SCRATCH_RESERVATION_BYTES = 1024 * 1024 * 1024 # 1 GiB
+JOB_RESULT_RESERVATION_BYTES = 512 * 1024 * 1024   # 512 MiB
 
 # Enhanced HTTP headers for yt-dlp
 COMMON_HTTP_HEADERS = {
@@ -20,3 +30,37 @@ COMMON_HTTP_HEADERS = {
 # Cleanup settings
 CLEANUP_INTERVAL_SECONDS = 60 * 30 # 30 minutes
 CLEANUP_AGE_SECONDS = 60 * 60 * 2   # 2 hours
+
+# Async (ASGI) serving settings, used by app/asgi.py
+ASYNC_INFO_WORKERS = 8                # Executor threads for blocking yt-dlp info extraction
+ASYNC_DOWNLOAD_WORKERS = 4            # Executor threads running download_thread (yt-dlp + FFmpeg)
+ASYNC_CONTROL_WORKERS = 4             # Executor threads for job bookkeeping (admission, prefetch start/claim/cleanup)
+ASYNC_FILE_CHUNK_SIZE = 256 * 1024    # Bytes read per async file chunk in /download_file
+
+# Debug/diagnostics settings
+TRACE_BUFFER_SIZE = 5000                      # Most recent tracing spans kept in memory
+ADMIN_TOKEN = os.environ.get('ADMIN_TOKEN')   # Enables /debug/* endpoints (send as X-Admin-Token header)
+
+# Segmented encoding: sources at least this long are split at keyframes and the
+# pieces are encoded by several FFmpeg processes in parallel (1 worker disables it)
+SEGMENTED_ENCODE_MIN_DURATION = 20 * 60                           # Seconds
+SEGMENTED_ENCODE_WORKERS = max(1, (os.cpu_count() or 2) // 2)     # Concurrent FFmpeg segment encodes
+SEGMENTED_ENCODE_SEGMENTS_PER_WORKER = 2                          # More segments than workers evens out keyframe-aligned splits
+
+# Speculative prefetch: right after /fetch_video_info, start downloading the format
+# users most often pick on that platform, so a matching /start_download can attach to it
+PREFETCH_ENABLED = True
+PREFETCH_BUDGET = 2             # Max unclaimed speculative jobs at any time
+PREFETCH_MAX_ACTIVE_JOBS = 2    # Only prefetch while fewer real jobs than this are running
+PREFETCH_TTL_SECONDS = 90       # Unclaimed speculative jobs are cancelled and deleted after this
+PREFETCH_NICENESS = 10          # CPU niceness of speculative jobs and their FFmpeg processes (Linux)
+
+# Rendition mode: a YouTube MP4 request also derives every lower offered resolution and
+# both MP3 bitrates from the same download, in a single multi-output FFmpeg pass.
+# Later requests for those formats of the same video are served without downloading.
+# Sources that get the segmented encode (see above) don't derive renditions.
+RENDITION_MODE = False
+
+# Max FFmpeg encodes running at once across all jobs (0 = unlimited). Speculative
+# prefetch jobs never take the last free slot and yield to waiting real jobs
+MAX_CONCURRENT_ENCODES = 0
@@ -5,19 +5,125 @@ import traceback
 import subprocess
 import shutil
 import threading
+import uuid
 import yt_dlp
 
 # Import necessary components from the app package
-from . import download_progress, progress_lock
-from .config import COMMON_HTTP_HEADERS, DOWNLOAD_FOLDER_PATH # Use absolute path from config
-from .utils import parse_ffmpeg_time
+from . import download_progress as shared_download_progress, progress_lock as shared_progress_lock
+from .config import COMMON_HTTP_HEADERS, DOWNLOAD_FOLDER_PATH, SCRATCH_FOLDER_PATH, SEGMENTED_ENCODE_MIN_DURATION, SEGMENTED_ENCODE_WORKERS, PREFETCH_NICENESS, RENDITION_MODE, MAX_CONCURRENT_ENCODES # Use absolute paths from config
+from .utils import parse_ffmpeg_time, JobCancelled, MP3_BITRATES
+from .storage import admit_job, release_job, check_free_space
+from .tracing import record_span, start_job_profile, finish_job_profile
+from .transcode import VIDEO_ENCODE_ARGS, AUDIO_ENCODE_ARGS, has_audio_stream, run_ffmpeg, segmented_encode, encode_renditions
+from .renditions import lookup as lookup_rendition, register as register_rendition, plan_renditions, publish_renditions, discard_renditions
+
+# --- Encode Concurrency ---
+# FFmpeg encodes are CPU-bound; a slot pool caps how many run at once across jobs
+# (downloads keep going while a job waits for an encode slot).
+
+class EncodeSlots:
+    """Counting semaphore that keeps speculative (low-priority) jobs out of real jobs' way.
+
+    A low-priority job only takes a slot while another one stays free and no
+    real job is waiting, so a real job never queues behind a speculative one
+    for the last slot. Priority is re-checked while waiting: a speculative job
+    claimed by a user competes like a real job from then on.
+    """
+    def __init__(self, limit):
+        self._free = limit; self._real_waiting = 0
+        self._condition = threading.Condition()
+
+    def acquire(self, is_low_priority=lambda: False, cancel_event=None):
+        """Blocks until a slot is granted. Raises JobCancelled if cancel_event is set meanwhile."""
+        with self._condition:
+            counted_as_real = False
+            try:
+                while True:
+                    if cancel_event is not None and cancel_event.is_set(): raise JobCancelled("Job cancelled while waiting for an encode slot.")
+                    low = is_low_priority()
+                    if counted_as_real == low: # Priority changed (or first pass): update the real-waiter count
+                        self._real_waiting += -1 if low else 1; counted_as_real = not low
+                    if (self._free > 0) if not low else (self._free > 1 and self._real_waiting == 0):
+                        self._free -= 1
+                        return
+                    self._condition.wait(timeout=1.0) # Wakes on release; the timeout re-checks cancel/claim
+            finally:
+                if counted_as_real: self._real_waiting -= 1
+
+    def release(self):
+        with self._condition:
+            self._free += 1
+            self._condition.notify_all()
+
+_encode_slots = None
+
+def set_encode_concurrency(limit):
+    """Limits concurrent encodes to `limit` (0 or None for unlimited)."""
+    global _encode_slots
+    _encode_slots = EncodeSlots(limit) if limit and limit > 0 else None
+
+set_encode_concurrency(MAX_CONCURRENT_ENCODES)
+
+# --- Job Launch ---
+
+def launch_download(url, format_id, executor=None, cancel_event=None, low_priority=False, reuse_renditions=False, claimed_event=None):
+    """Starts download_thread for a new job. Returns (download_id, error).
+
+    Jobs are only admitted when both storage tiers can cover their space
+    reservation. By default each job gets its own daemon thread; the async
+    server passes an executor so yt-dlp/FFmpeg work runs on a bounded pool.
+    cancel_event, low_priority and claimed_event are passed through to download_thread.
+    With reuse_renditions (user requests only) in rendition mode, an already
+    derived rendition is returned without starting a job; callers that own and
+    clean up the jobs they start (prefetch) must leave it off.
+    """
+    if RENDITION_MODE and reuse_renditions:
+        existing_id = lookup_rendition(url, format_id)
+        if existing_id:
+            print(f"Renditions: Serving existing rendition {existing_id} for Format: {format_id}")
+            return existing_id, None
+    download_id = str(uuid.uuid4())
+    admitted, error = admit_job(download_id)
+    if not admitted:
+        return None, error
+    # The download thread creates the specific subdirectory: DOWNLOAD_FOLDER_PATH / download_id
+    args = (url, format_id, DOWNLOAD_FOLDER_PATH, download_id, time.time(), cancel_event, low_priority)
+    if executor is not None:
+        # Register the job now so pollers see it while it waits for a free worker
+        with shared_progress_lock:
+            shared_download_progress[download_id] = {
+                'status': 'starting', 'progress': 0, 'filename': None,
+                'final_filename': None, 'filepath': None, 'error': None,
+                'start_time': time.time(), '_download_phase': 1,
+                '_last_hook_status': None, 'info_text': 'Waiting for a free worker...'
+            }
+        executor.submit(download_thread, *args, claimed_event=claimed_event)
+    else:
+        thread = threading.Thread(target=download_thread, args=args, kwargs={'claimed_event': claimed_event}, name=f"DownloadThread-{download_id[:8]}")
+        thread.daemon = True # Allow main program to exit even if threads are running
+        thread.start()
+    return download_id, None
 
 # --- Download Thread ---
 
-def download_thread(url, format_id, output_path_base, download_id):
-    """Thread function to download the video and optionally re-encode."""
+def download_thread(url, format_id, output_path_base, download_id, queued_at=None, cancel_event=None, low_priority=False,
+                    download_progress=None, progress_lock=None, scratch_path_base=None, claimed_event=None):
+    """Thread function to download the video and optionally re-encode.
+
+    Intermediates live in SCRATCH_FOLDER_PATH/<id>; only the finished file is
+    written to (or atomically published into) output_path_base/<id>.
+    Each stage is recorded as a tracing span under the download ID.
+
+    Setting cancel_event aborts the job and deletes its files and progress entry.
+    low_priority raises the niceness of this thread (and the FFmpeg processes it spawns)
+    and yields encode slots to real jobs until claimed_event (if given) is set.
+    Headless callers pass their own download_progress dict/lock and scratch root
+    instead of the web app's shared state.
+    """
+    if download_progress is None: download_progress, progress_lock = shared_download_progress, shared_progress_lock
     start_time = time.time()
     output_path = os.path.join(output_path_base, download_id)
+    scratch_path = os.path.join(scratch_path_base or SCRATCH_FOLDER_PATH, download_id)
 
     initial_progress_data = {
         'status': 'starting', 'progress': 0, 'filename': None,
@@ -26,29 +132,42 @@ def download_thread(url, format_id, output_path_base, download_id):
         '_last_hook_status': None, 'info_text': 'Initializing...'
     }
 
-    with progress_lock:
-        try:
-             if not os.path.exists(output_path): os.makedirs(output_path, exist_ok=True)
-        except OSError as e:
-             print(f"CRITICAL [{download_id}]: Failed to create download dir {output_path}: {e}")
-             initial_progress_data.update({'status': 'error', 'error': f'Server setup error: {e}', '_download_phase': 0, 'info_text': f'Failed: {e}'})
-             download_progress[download_id] = initial_progress_data
-             return
+    # Filesystem calls stay outside progress_lock: pollers (and the async event loop) take that lock
+    try:
+         if not os.path.exists(output_path): os.makedirs(output_path, exist_ok=True)
+         if not os.path.exists(scratch_path): os.makedirs(scratch_path, exist_ok=True)
+    except OSError as e:
+         print(f"CRITICAL [{download_id}]: Failed to create download dir {output_path}: {e}")
+         initial_progress_data.update({'status': 'error', 'error': f'Server setup error: {e}', '_download_phase': 0, 'info_text': f'Failed: {e}'})
+         with progress_lock: download_progress[download_id] = initial_progress_data
+         release_job(download_id)
+         return
 
+    with progress_lock:
         download_progress[download_id] = initial_progress_data
 
+    record_span(download_id, 'queue', queued_at, start_time)
+    if low_priority:
+        try: os.setpriority(os.PRIO_PROCESS, threading.get_native_id(), PREFETCH_NICENESS) # Per-thread on Linux
+        except (AttributeError, OSError) as nice_err: print(f"Info [{download_id}]: Could not lower job priority: {nice_err}")
+    profiler = start_job_profile()
+    stage_marks = {} # Hook timestamps used to split the yt-dlp call into extract/download/post-process spans
+
     try:
         # --- Progress Hook ---
         def progress_hook(d):
             # Add a log at the very beginning of the hook
             # print(f"Hook [{download_id}]: Received hook data - Status: {d.get('status')}") # Optional: Uncomment for very verbose hook logging
             if d is None: return
+            if cancel_event is not None and cancel_event.is_set(): raise yt_dlp.utils.DownloadCancelled('Job cancelled.')
             with progress_lock:
                 if download_id not in download_progress: return
                 current_progress_data = download_progress[download_id]
                 if current_progress_data.get('status') in ['complete', 'error']: return
 
                 hook_status = d['status']
+                if hook_status == 'downloading': stage_marks.setdefault('first_downloading', time.time())
+                elif hook_status == 'finished': stage_marks['last_finished'] = time.time()
                 hook_filename = os.path.basename(d.get('filename', '')) or current_progress_data.get('filename', 'download')
                 current_phase = current_progress_data.get('_download_phase', 1)
                 last_hook_status = current_progress_data.get('_last_hook_status')
@@ -99,7 +218,7 @@ def download_thread(url, format_id, output_path_base, download_id):
 
 
         # --- Configure yt-dlp options ---
-        base_outtmpl = os.path.join(output_path, '%(id)s.%(ext)s')
+        base_outtmpl = os.path.join(scratch_path, '%(id)s.%(ext)s')
         ydl_opts = {
             'progress_hooks': [progress_hook], 'http_headers': COMMON_HTTP_HEADERS,
             'outtmpl': base_outtmpl, 'quiet': True, 'no_warnings': True, 'verbose': False,
@@ -108,11 +227,10 @@ def download_thread(url, format_id, output_path_base, download_id):
         is_audio_only = False; final_expected_ext = '.mp4'
         if format_id == 'default': ydl_opts['format'] = 'bestvideo+bestaudio/best'; ydl_opts['merge_output_format'] = 'mp4';
         elif format_id.startswith('mp3_'):
-            is_audio_only = True; final_expected_ext = '.mp3';
-            quality = '192' if format_id == 'mp3_high' else '128';
+            is_audio_only = True; final_expected_ext = ''; # Source audio in whatever container; converted to MP3 below
+            quality = MP3_BITRATES.get(format_id, '128');
             ydl_opts['format'] = 'bestaudio/best';
-            ydl_opts['postprocessors'] = [{'key': 'FFmpegExtractAudio', 'preferredcodec': 'mp3', 'preferredquality': quality}];
-            ydl_opts['outtmpl'] = os.path.join(output_path, '%(title)s.%(ext)s')
+            ydl_opts['outtmpl'] = os.path.join(scratch_path, '%(title)s.%(ext)s')
             with progress_lock:
                 if download_id in download_progress: download_progress[download_id]['_download_phase'] = 3; download_progress[download_id]['info_text'] = 'Downloading audio...';
         else:
@@ -128,6 +246,7 @@ def download_thread(url, format_id, output_path_base, download_id):
 
             # --- ADDED LOGS AROUND YT-DLP EXECUTION ---
             print(f"DEBUG [{download_id}]: >>> ENTERING yt-dlp context manager <<<")
+            ydl_start = time.time()
             try:
                 with yt_dlp.YoutubeDL(ydl_opts) as ydl:
                     print(f"DEBUG [{download_id}]: Inside context manager, calling ydl.extract_info...")
@@ -137,6 +256,11 @@ def download_thread(url, format_id, output_path_base, download_id):
                  print(f"ERROR [{download_id}]: Exception occurred *during* yt-dlp context manager execution: {ydl_ctx_err}")
                  print(traceback.format_exc()) # Print detailed traceback for this specific error
                  raise # Re-raise the exception to be caught by the main handler below
+            finally:
+                ydl_end = time.time(); first_downloading = stage_marks.get('first_downloading'); last_finished = stage_marks.get('last_finished')
+                record_span(download_id, 'extract', ydl_start, first_downloading or ydl_end, format=format_id)
+                record_span(download_id, 'download', first_downloading, last_finished or ydl_end)
+                if not is_audio_only: record_span(download_id, 'merge', last_finished, ydl_end)
             print(f"DEBUG [{download_id}]: >>> EXITING yt-dlp context manager <<<")
             # --- END ADDED LOGS ---
 
@@ -179,18 +303,20 @@ def download_thread(url, format_id, output_path_base, download_id):
 
             # --- Determine final file path ---
             # (File path finding logic remains the same)
+            locate_start = time.time()
             if downloaded_info:
                 if 'requested_downloads' in downloaded_info and downloaded_info['requested_downloads']: final_filepath = downloaded_info['requested_downloads'][0].get('filepath')
                 if not final_filepath: final_filepath = downloaded_info.get('filepath') or downloaded_info.get('_filename')
                 if not final_filepath and 'entries' in downloaded_info and downloaded_info['entries']: final_filepath = downloaded_info['entries'][0].get('filepath') or downloaded_info['entries'][0].get('_filename')
             if not final_filepath or not os.path.exists(final_filepath):
-                print(f"Warning: Could not reliably determine final filename for {download_id}. Scanning {output_path}.")
-                potential_files = [os.path.join(output_path, f) for f in os.listdir(output_path) if os.path.isfile(os.path.join(output_path, f)) and f.lower().endswith(final_expected_ext)]
+                print(f"Warning: Could not reliably determine final filename for {download_id}. Scanning {scratch_path}.")
+                stage_marks['fallback_scan'] = True
+                potential_files = [os.path.join(scratch_path, f) for f in os.listdir(scratch_path) if os.path.isfile(os.path.join(scratch_path, f)) and f.lower().endswith(final_expected_ext)]
                 if potential_files: potential_files.sort(key=os.path.getmtime, reverse=True); final_filepath = potential_files[0]; print(f"Fallback Scan: Selected newest matching file '{os.path.basename(final_filepath)}'.")
                 else:
-                     all_files = [os.path.join(output_path, f) for f in os.listdir(output_path) if os.path.isfile(os.path.join(output_path, f))]
+                     all_files = [os.path.join(scratch_path, f) for f in os.listdir(scratch_path) if os.path.isfile(os.path.join(scratch_path, f))]
                      if all_files: all_files.sort(key=os.path.getmtime, reverse=True); final_filepath = all_files[0]; print(f"Last Resort Fallback: Selected newest file '{os.path.basename(final_filepath)}'.")
-                     else: raise FileNotFoundError(f"State corrected, but could not find any media file in {output_path} for {download_id}.")
+                     else: raise FileNotFoundError(f"State corrected, but could not find any media file in {scratch_path} for {download_id}.")
             if not final_filepath or not os.path.exists(final_filepath): raise FileNotFoundError(f"Final file path determination failed after correction. Path ('{final_filepath}') not found for {download_id}.")
 
 
@@ -199,14 +325,15 @@ def download_thread(url, format_id, output_path_base, download_id):
             base_title = downloaded_info.get('title', 'downloaded_video') if downloaded_info else 'downloaded_video'
             sanitized_title = re.sub(r'[\\/*?:"<>|]', '_', base_title)[:150]; file_ext = os.path.splitext(final_filepath)[1]
             if not file_ext: file_ext = final_expected_ext
-            final_target_basename = f"{sanitized_title}{file_ext}"; final_target_path = os.path.join(output_path, final_target_basename)
+            final_target_basename = f"{sanitized_title}{file_ext}"; final_target_path = os.path.join(scratch_path, final_target_basename)
             if os.path.abspath(final_filepath) != os.path.abspath(final_target_path):
                 print(f"Renaming '{os.path.basename(final_filepath)}' to '{final_target_basename}' for {download_id}")
                 try:
                     if os.path.exists(final_target_path): os.remove(final_target_path)
-                    shutil.move(final_filepath, final_target_path); final_filepath = final_target_path
+                    os.replace(final_filepath, final_target_path); final_filepath = final_target_path
                 except Exception as move_err: print(f"Warning: Failed to rename file: {move_err}. Using original: {os.path.basename(final_filepath)}"); final_target_basename = os.path.basename(final_filepath)
             else: print(f"Skipping rename for {download_id}, source/target same: {final_target_basename}")
+            record_span(download_id, 'locate_and_rename', locate_start, time.time(), used_fallback_scan=stage_marks.get('fallback_scan', False))
 
 
             # --- Optional Re-encoding ---
@@ -221,49 +348,87 @@ def download_thread(url, format_id, output_path_base, download_id):
                 with progress_lock:
                     if download_id in download_progress and download_progress[download_id].get('status') != 'error':
                         download_progress[download_id].update({'status': 're-encoding', 'progress': 0, 'filename': final_target_basename, 'info_text': 'Optimizing format...' if total_duration else 'Optimizing format (progress unavailable)...', 'error': None})
+                # Encode straight onto the result volume; a .part name keeps readers off the file until it is complete
                 quicktime_basename = f"{os.path.splitext(final_target_basename)[0]}_quicktime.mp4"; quicktime_filepath = os.path.join(output_path, quicktime_basename)
-                ffmpeg_command = ['ffmpeg', '-v', 'quiet', '-stats', '-y', '-i', final_filepath, '-c:v', 'libx264', '-profile:v', 'high', '-level', '4.1', '-preset', 'fast', '-pix_fmt', 'yuv420p', '-c:a', 'aac', '-b:a', '192k', '-movflags', '+faststart', quicktime_filepath]
-                process = None
+                quicktime_partpath = quicktime_filepath + '.part'
+                ffmpeg_command = ['ffmpeg', '-v', 'quiet', '-stats', '-y', '-i', final_filepath, *VIDEO_ENCODE_ARGS, *AUDIO_ENCODE_ARGS, '-movflags', '+faststart', '-f', 'mp4', quicktime_partpath]
+                # Rendition mode derives lower resolutions/MP3s in the same pass (one decode, several encodes);
+                # otherwise long sources are split and encoded by several FFmpeg processes in parallel
+                has_audio = downloaded_info.get('acodec') != 'none' and has_audio_stream(final_filepath) # acodec may be missing
+                use_segmented = bool(total_duration) and total_duration >= SEGMENTED_ENCODE_MIN_DURATION and SEGMENTED_ENCODE_WORKERS > 1
+                # Long sources keep the parallel segmented encode and skip renditions: one FFmpeg doing several encodes would be the long pole again
+                use_renditions = RENDITION_MODE and format_id.startswith('mp4_') and not use_segmented
+                process = None; rendition_outputs = []
+                encode_slots = _encode_slots; encode_start = time.time()
+                if encode_slots is not None:
+                    # Wait for a free encode slot; speculative jobs only use spare ones until claimed
+                    encode_slots.acquire(lambda: low_priority and not (claimed_event is not None and claimed_event.is_set()), cancel_event)
+                    record_span(download_id, 'encode_wait', encode_start, time.time()); encode_start = time.time()
                 try:
-                    print(f"DEBUG [{download_id}]: Preparing to execute FFmpeg command: {' '.join(ffmpeg_command)}")
-                    process = subprocess.Popen(ffmpeg_command, stderr=subprocess.PIPE, stdout=subprocess.DEVNULL, text=True, encoding='utf-8', errors='replace', bufsize=1)
-                    print(f"DEBUG [{download_id}]: FFmpeg process started (PID: {process.pid}). Reading stderr...")
-                    initial_poll = process.poll();
-                    if initial_poll is not None: print(f"WARNING [{download_id}]: FFmpeg process exited immediately after start with code {initial_poll}.")
-                    print(f"DEBUG [{download_id}]: Entering FFmpeg stderr reading loop...")
-                    lines_processed = 0; last_logged_percent = -1
-                    while True:
-                        if process.stderr is None: print(f"DEBUG [{download_id}]: Loop start: stderr is None. Breaking."); break
-                        line = process.stderr.readline()
-                        if not line: final_poll = process.poll(); print(f"DEBUG [{download_id}]: Loop: readline() returned empty. Process poll: {final_poll}. Breaking."); break
-                        lines_processed += 1
-                        # print(f"FFMPEG_RAW_LINE [{download_id}][{lines_processed}]: {line.strip()}") # Uncomment for extreme debug
-                        if total_duration:
-                            match = re.search(r"time=(\d{2}:\d{2}:\d{2}\.\d+)", line)
-                            if match:
-                                current_time_str = match.group(1); current_time_sec = parse_ffmpeg_time(current_time_str)
-                                if current_time_sec is not None:
-                                    progress_percent = min(max(round((current_time_sec / total_duration) * 100, 1), 0), 99.9)
-                                    should_update = False; current_prog = -1
-                                    with progress_lock:
-                                        if download_id in download_progress and download_progress[download_id].get('status') == 're-encoding':
-                                            current_prog = download_progress[download_id].get('progress', 0)
-                                            if progress_percent > current_prog: download_progress[download_id]['progress'] = progress_percent; should_update = True
-                                        else: print(f"DEBUG [{download_id}]: Status changed during FFmpeg parsing. Stopping."); break
-                                    if should_update and (progress_percent > last_logged_percent + 1 or progress_percent > 99):
-                                        print(f"DEBUG [{download_id}]: Updated FFmpeg progress from {current_prog:.1f}% to {progress_percent:.1f}% (time={current_time_str})")
-                                        last_logged_percent = progress_percent
-                    print(f"DEBUG [{download_id}]: Exited FFmpeg stderr loop. Lines: {lines_processed}")
-                    print(f"DEBUG [{download_id}]: Waiting for FFmpeg process finish...")
-                    process.wait(); return_code = process.returncode
-                    print(f"DEBUG [{download_id}]: FFmpeg process finished code: {return_code}")
-                    if return_code != 0:
-                        error_output = "";
-                        try:
-                            if process.stderr and not process.stderr.closed: error_output = process.stderr.read(4096)
-                        except Exception as e: print(f"Error reading final stderr {download_id}: {e}")
-                        print(f"!!! FFmpeg Error {download_id} !!!\nCMD: {' '.join(ffmpeg_command)}\nRC: {return_code}\nSTDERR: {error_output}\n!!! End FFmpeg Error !!!"); raise Exception(f"FFmpeg failed (code {return_code}).")
+                    if cancel_event is not None and cancel_event.is_set(): raise JobCancelled("Job cancelled before encoding.")
+                    if use_renditions: rendition_outputs = plan_renditions(format_id, downloaded_info, os.path.splitext(final_target_basename)[0], output_path_base, has_audio)
+                    check_free_space(output_path, os.path.getsize(final_filepath) * (1 + len(rendition_outputs)), download_id) # Each output is at most roughly source-sized
+                    if rendition_outputs:
+                        def on_rendition_time(current_time_sec):
+                            if cancel_event is not None and cancel_event.is_set(): raise JobCancelled("Encode cancelled.")
+                            if not total_duration: return
+                            progress_percent = min(max(round((current_time_sec / total_duration) * 100, 1), 0), 99.9)
+                            with progress_lock:
+                                if download_id in download_progress and download_progress[download_id].get('status') == 're-encoding' and progress_percent > download_progress[download_id].get('progress', 0):
+                                    download_progress[download_id]['progress'] = progress_percent
+                        print(f"INFO [{download_id}]: Rendition mode, also deriving {', '.join(r['itag'] for r in rendition_outputs)} in one FFmpeg pass.")
+                        encode_renditions(final_filepath, quicktime_partpath, rendition_outputs, has_audio=has_audio, on_time=on_rendition_time)
+                    elif use_segmented:
+                        def on_segmented_progress(progress_percent):
+                            with progress_lock:
+                                if download_id in download_progress and download_progress[download_id].get('status') == 're-encoding' and progress_percent > download_progress[download_id].get('progress', 0):
+                                    download_progress[download_id]['progress'] = progress_percent
+                        print(f"INFO [{download_id}]: Duration {total_duration}s >= {SEGMENTED_ENCODE_MIN_DURATION}s, using segmented parallel encode.")
+                        segmented_encode(final_filepath, quicktime_partpath, total_duration, scratch_path, on_segmented_progress,
+                                         has_audio=has_audio, trace_id=download_id, cancel_event=cancel_event)
+                    else:
+                        print(f"DEBUG [{download_id}]: Preparing to execute FFmpeg command: {' '.join(ffmpeg_command)}")
+                        process = subprocess.Popen(ffmpeg_command, stderr=subprocess.PIPE, stdout=subprocess.DEVNULL, text=True, encoding='utf-8', errors='replace', bufsize=1, start_new_session=True) # Own session: a terminal Ctrl-C only reaches Python
+                        print(f"DEBUG [{download_id}]: FFmpeg process started (PID: {process.pid}). Reading stderr...")
+                        initial_poll = process.poll();
+                        if initial_poll is not None: print(f"WARNING [{download_id}]: FFmpeg process exited immediately after start with code {initial_poll}.")
+                        print(f"DEBUG [{download_id}]: Entering FFmpeg stderr reading loop...")
+                        lines_processed = 0; last_logged_percent = -1
+                        while True:
+                            if process.stderr is None: print(f"DEBUG [{download_id}]: Loop start: stderr is None. Breaking."); break
+                            line = process.stderr.readline()
+                            if not line: final_poll = process.poll(); print(f"DEBUG [{download_id}]: Loop: readline() returned empty. Process poll: {final_poll}. Breaking."); break
+                            lines_processed += 1
+                            if cancel_event is not None and cancel_event.is_set(): raise JobCancelled("Encode cancelled.")
+                            # print(f"FFMPEG_RAW_LINE [{download_id}][{lines_processed}]: {line.strip()}") # Uncomment for extreme debug
+                            if total_duration:
+                                match = re.search(r"time=(\d{2}:\d{2}:\d{2}\.\d+)", line)
+                                if match:
+                                    current_time_str = match.group(1); current_time_sec = parse_ffmpeg_time(current_time_str)
+                                    if current_time_sec is not None:
+                                        progress_percent = min(max(round((current_time_sec / total_duration) * 100, 1), 0), 99.9)
+                                        should_update = False; current_prog = -1
+                                        with progress_lock:
+                                            if download_id in download_progress and download_progress[download_id].get('status') == 're-encoding':
+                                                current_prog = download_progress[download_id].get('progress', 0)
+                                                if progress_percent > current_prog: download_progress[download_id]['progress'] = progress_percent; should_update = True
+                                            else: print(f"DEBUG [{download_id}]: Status changed during FFmpeg parsing. Stopping."); break
+                                        if should_update and (progress_percent > last_logged_percent + 1 or progress_percent > 99):
+                                            print(f"DEBUG [{download_id}]: Updated FFmpeg progress from {current_prog:.1f}% to {progress_percent:.1f}% (time={current_time_str})")
+                                            last_logged_percent = progress_percent
+                        print(f"DEBUG [{download_id}]: Exited FFmpeg stderr loop. Lines: {lines_processed}")
+                        print(f"DEBUG [{download_id}]: Waiting for FFmpeg process finish...")
+                        process.wait(); return_code = process.returncode
+                        print(f"DEBUG [{download_id}]: FFmpeg process finished code: {return_code}")
+                        if return_code != 0:
+                            error_output = "";
+                            try:
+                                if process.stderr and not process.stderr.closed: error_output = process.stderr.read(4096)
+                            except Exception as e: print(f"Error reading final stderr {download_id}: {e}")
+                            print(f"!!! FFmpeg Error {download_id} !!!\nCMD: {' '.join(ffmpeg_command)}\nRC: {return_code}\nSTDERR: {error_output}\n!!! End FFmpeg Error !!!"); raise Exception(f"FFmpeg failed (code {return_code}).")
                     print(f"FFmpeg re-encoding successful for {download_id}.")
+                    os.replace(quicktime_partpath, quicktime_filepath) # Atomic publish within the result volume
+                    if rendition_outputs: publish_renditions(downloaded_info.get('id'), rendition_outputs, download_id, download_progress, progress_lock)
                     with progress_lock:
                          if download_id in download_progress and download_progress[download_id].get('status') == 're-encoding': download_progress[download_id]['progress'] = 100.0; download_progress[download_id]['info_text'] = "Re-encoding complete."
                     try:
@@ -273,6 +438,7 @@ def download_thread(url, format_id, output_path_base, download_id):
                     final_filepath = quicktime_filepath; final_target_basename = quicktime_basename
                 except FileNotFoundError:
                     print(f"ERROR [{download_id}]: FFmpeg command not found. Make sure FFmpeg is installed and in system PATH.")
+                    discard_renditions(rendition_outputs)
                     with progress_lock:
                         if download_id in download_progress:
                             download_progress[download_id].update({'status':'error', 'error':'FFmpeg not found', 'info_text':'Error: FFmpeg not found.'})
@@ -282,17 +448,39 @@ def download_thread(url, format_id, output_path_base, download_id):
                         print(f"Terminating FFmpeg process {download_id} due to error: {ffmpeg_err}"); process.terminate()
                         try: process.wait(timeout=5)
                         except subprocess.TimeoutExpired: print(f"FFmpeg kill {download_id}."); process.kill()
+                    if os.path.exists(quicktime_partpath): os.remove(quicktime_partpath) # Never leave partial output on the result volume
+                    discard_renditions(rendition_outputs)
                     with progress_lock:
                          if download_id in download_progress: download_progress[download_id].update({'status':'error', 'error':f'FFmpeg processing failed: {ffmpeg_err}', 'info_text':f'Error: {ffmpeg_err}'})
                     raise ffmpeg_err
+                finally:
+                    if encode_slots is not None: encode_slots.release()
+                    record_span(download_id, 'encode', encode_start, time.time(), duration=total_duration, segmented=use_segmented, renditions=len(rendition_outputs))
 
             else: # is_audio_only was True
                 print(f"DEBUG [{download_id}]: Skipping FFmpeg re-encoding block because is_audio_only is True.")
                 with progress_lock:
-                     if download_id in download_progress and download_progress[download_id]['status'] == 'processing':
-                          download_progress[download_id]['_download_phase'] = 5
-                          download_progress[download_id]['progress'] = 99.9
-                          download_progress[download_id]['info_text'] = "Converting audio to MP3..."
+                     if download_id in download_progress and download_progress[download_id].get('status') != 'error':
+                          download_progress[download_id].update({'status': 'processing', 'progress': 99.0, 'info_text': "Converting audio to MP3..."})
+                # Like the video encode: convert from scratch straight onto the result volume under a .part name
+                final_target_basename = f"{os.path.splitext(final_target_basename)[0]}.mp3"; mp3_filepath = os.path.join(output_path, final_target_basename)
+                mp3_partpath = mp3_filepath + '.part'; audio_start = time.time()
+                def on_audio_time(current_time_sec):
+                    if cancel_event is not None and cancel_event.is_set(): raise JobCancelled("Audio conversion cancelled.")
+                try:
+                    check_free_space(output_path, os.path.getsize(final_filepath), download_id) # MP3 is at most roughly source-sized
+                    run_ffmpeg(['ffmpeg', '-v', 'quiet', '-stats', '-y', '-i', final_filepath, '-vn', '-map', '0:a:0', '-c:a', 'libmp3lame', '-b:a', f"{quality}k", '-f', 'mp3', mp3_partpath], on_time=on_audio_time)
+                    os.replace(mp3_partpath, mp3_filepath) # Atomic publish within the result volume
+                    # The source audio may share the result directory (no separate scratch tier); don't keep it
+                    try:
+                        if os.path.abspath(final_filepath) != os.path.abspath(mp3_filepath) and os.path.exists(final_filepath): os.remove(final_filepath); print(f"Removed original: {os.path.basename(final_filepath)}")
+                    except OSError as remove_err: print(f"Warning: Could not remove original '{os.path.basename(final_filepath)}': {remove_err}")
+                    final_filepath = mp3_filepath
+                except BaseException:
+                    if os.path.exists(mp3_partpath): os.remove(mp3_partpath) # Never leave partial output on the result volume
+                    raise
+                finally:
+                    record_span(download_id, 'audio_extract', audio_start, time.time(), bitrate=quality)
 
 
             # --- Final Success Update ---
@@ -307,6 +495,7 @@ def download_thread(url, format_id, output_path_base, download_id):
                         'final_filename': final_target_basename, 'filepath': final_filepath, 'error': None,
                         'info_text': final_info, '_download_phase': 5 # Final phase
                     })
+                    if RENDITION_MODE and downloaded_info and download_progress is shared_download_progress: register_rendition(downloaded_info.get('id'), format_id, download_id)
             print(f"Download and processing complete for {download_id}: {final_target_basename}")
 
         # --- Main Exception Handling Block ---
@@ -330,4 +519,19 @@ def download_thread(url, format_id, output_path_base, download_id):
         with progress_lock:
              if download_id in download_progress: download_progress[download_id].update({'status': 'error', 'progress': 0, 'error': f"Failed to start process: {outer_err}", '_download_phase': 0, 'info_text': f"Failed: {outer_err}"})
 
+    finally:
+        # Intermediates are never served, so the scratch directory goes as soon as the job ends
+        if os.path.abspath(scratch_path) != os.path.abspath(output_path):
+            shutil.rmtree(scratch_path, ignore_errors=True)
+        release_job(download_id)
+        finish_job_profile(profiler, download_id)
+        with progress_lock:
+            final_status = download_progress.get(download_id, {}).get('status')
+        record_span(download_id, 'job', start_time, time.time(), url=url[:200], format=format_id, status=final_status)
+        if cancel_event is not None and cancel_event.is_set():
+            # Cancelled jobs leave nothing behind
+            print(f"Job {download_id} was cancelled, removing its files.")
+            shutil.rmtree(output_path, ignore_errors=True)
+            with progress_lock: download_progress.pop(download_id, None)
+
 # --- END OF FILE app/download_manager.py ---
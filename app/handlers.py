@@ -0,0 +1,180 @@
+import os
+import traceback
+
+from . import download_progress, progress_lock
+from .utils import get_video_info, normalize_url, info_error_status, build_video_details
+from .download_manager import launch_download
+from .prefetch import maybe_prefetch, claim, record_choice, preempt_for_real_job, prefetch_stats
+from .tracing import get_spans, to_chrome_trace, is_admin, arm_profiling, profile_report, profile_dump
+
+# --- Shared Route Logic ---
+# Framework-neutral bodies of the routes in app/routes.py (Flask) and app/asgi.py
+# (Quart). Each returns a JSON-able payload plus an HTTP status code; the route
+# modules only parse the request, choose where blocking work runs and build the response.
+
+NOT_FOUND = ({'error': 'Not found'}, 404) # Debug routes hide themselves from non-admins
+
+def parse_video_url(data):
+    """Validates a /fetch_video_info body. Returns (url, None) or (None, (payload, status))."""
+    if not data or 'url' not in data:
+        return None, ({'error': 'No URL provided'}, 400)
+    url, url_error = normalize_url(data['url'])
+    if url_error:
+        return None, ({'error': url_error}, 400)
+    return url, None
+
+def fetch_video_info(url):
+    """Runs yt-dlp info extraction for a validated URL. Blocking."""
+    print(f"Fetching info for URL: {url}")
+    return get_video_info(url)
+
+def video_info_response(url, info, error):
+    """Turns get_video_info's result into the response, starting a prefetch on success."""
+    if error:
+        print(f"Error fetching info for {url}: {error}")
+        return {'error': error}, info_error_status(error)
+
+    if not info:
+        print(f"No info dictionary returned for {url} despite no explicit error.")
+        return {'error': 'Could not retrieve video information (no data).'}, 500
+
+    try:
+        video_details = build_video_details(url, info)
+        print(f"Successfully fetched info for {url}, Title: {video_details['title']}")
+        # Use the user's think time: start the likely format if the server is idle
+        maybe_prefetch(url, [stream['itag'] for stream in video_details['streams']])
+        return video_details, 200
+
+    except Exception as e:
+        print(f"Error processing video info for {url}: {e}")
+        print(traceback.format_exc())
+        return {'error': 'Internal server error while processing video information.'}, 500
+
+def start_download(data, executor=None):
+    """Starts (or attaches to) a download job for a /start_download body.
+
+    Without an executor the job gets its own thread; the async server passes its download executor.
+    """
+    data = data or {}
+    url = data.get('url', '').strip()
+    itag = data.get('itag', '').strip() # 'itag' represents the format ID selected by user
+
+    if not url or not itag:
+        return {'error': 'URL and Format ID (itag) are required.'}, 400
+
+    # Attach to a speculative job for the same URL and format if one is running
+    download_id = claim(url, itag)
+    if download_id:
+        record_choice(url, itag)
+        return {'success': True, 'download_id': download_id}, 202
+
+    # The download thread will create the specific subdirectories under the result and scratch folders
+    download_id, error = launch_download(url, itag, executor=executor, reuse_renditions=True)
+    if error:
+        # 507 Insufficient Storage: the job was not admitted, nothing was started
+        return {'error': error}, 507
+    record_choice(url, itag) # Only started jobs count towards the prefetch prediction
+    preempt_for_real_job() # Speculative jobs must never compete with real ones
+
+    print(f"{'Queued' if executor is not None else 'Started'} download ID: {download_id}, URL: {url[:50]}..., Format: {itag}")
+    # 202 Accepted: the request is accepted for processing
+    return {'success': True, 'download_id': download_id}, 202
+
+def progress_response(download_id):
+    """Progress of a download, without the server-side filepath."""
+    if not download_id:
+        return {'status': 'error', 'error': 'No download ID provided'}, 400
+
+    # progress_lock is never held across filesystem calls, so taking it here never blocks for long
+    with progress_lock:
+        if download_id not in download_progress:
+            # Download ID not found, might be invalid, expired, or cleaned up
+            return {'status': 'not_found', 'error': 'Download ID not found or expired.'}, 404
+
+        progress_data = download_progress[download_id].copy()
+        progress_data.pop('filepath', None) # Remove server-side filepath from response
+
+    return progress_data, 200
+
+def locate_download_file(download_id):
+    """Checks a download is complete and on disk. Stats the file, so the async server runs it on an executor.
+
+    Returns (filepath, filename, None, None) when it can be sent, otherwise
+    (None, None, message, status) with a plain-text error.
+    """
+    if not download_id:
+        return None, None, "Invalid request: No download ID provided.", 400
+
+    with progress_lock:
+        if download_id not in download_progress:
+            return None, None, "Download not found or expired.", 404
+        progress_info = download_progress[download_id].copy()
+
+    # Check if the download is actually complete
+    if progress_info.get('status') != 'complete':
+        current_status = progress_info.get('status', 'unknown')
+        error_details = progress_info.get('error', 'Not complete or failed.')
+        print(f"Download attempt denied for {download_id}. Status: {current_status}. Error: {error_details}")
+        # 409 Conflict is appropriate here, the resource isn't in the state required for download
+        return None, None, f"Download not ready. Current status: {current_status}. Details: {error_details}", 409
+
+    filepath = progress_info.get('filepath')
+    filename = progress_info.get('final_filename') or progress_info.get('filename') # Use final_filename if available
+
+    if not filepath or not filename:
+        print(f"Error: File path or filename missing in progress info for completed download {download_id}.")
+        return None, None, "Server error: Essential file information is missing.", 500
+
+    # Double-check if the file physically exists before sending
+    if not os.path.exists(filepath):
+        print(f"Error: File not found at path '{filepath}' for completed download {download_id}.")
+        # Update status to error if file is missing post-completion
+        with progress_lock:
+            if download_id in download_progress:
+                 download_progress[download_id]['status'] = 'error'
+                 download_progress[download_id]['error'] = 'Completed file is missing from storage.'
+        return None, None, "Error: The downloaded file could not be found on the server.", 404
+
+    print(f"Sending file for download ID {download_id}: {filename}")
+    return filepath, filename, None, None
+
+# --- Debug Endpoints (enabled by setting ADMIN_TOKEN) ---
+
+def debug_traces(token, args):
+    """Buffered tracing spans as JSON, or Chrome trace JSON with ?format=chrome."""
+    if not is_admin(token):
+        return NOT_FOUND
+    spans = get_spans(args.get('trace_id'))
+    if args.get('format') == 'chrome':
+        return to_chrome_trace(spans), 200
+    return {'spans': spans}, 200
+
+def debug_arm_profile(token, data):
+    """POST {"jobs": N}: profiles the next N jobs."""
+    if not is_admin(token):
+        return NOT_FOUND
+    try: job_count = int((data or {}).get('jobs', 1))
+    except (TypeError, ValueError): return {'error': 'jobs must be an integer'}, 400
+    arm_profiling(job_count)
+    print(f"Profiling armed for the next {job_count} job(s).")
+    return {'success': True, 'remaining': job_count}, 200
+
+def debug_profile(token, args):
+    """GET: the merged profile report, or with ?format=pstats the raw .prof bytes.
+
+    Returns (payload, status, is_pstats_dump).
+    """
+    if not is_admin(token):
+        return NOT_FOUND + (False,)
+    if args.get('format') == 'pstats':
+        dump = profile_dump()
+        if dump is None:
+            return {'error': 'No profile collected yet'}, 404, False
+        return dump, 200, True
+    return profile_report(args.get('limit', 40, type=int)), 200, False
+
+def debug_prefetch(token):
+    """Speculative prefetch counters and hit rate."""
+    if not is_admin(token):
+        return NOT_FOUND
+    return prefetch_stats(), 200
@@ -0,0 +1,181 @@
+import os
+import shutil
+import threading
+from collections import Counter, defaultdict
+from urllib.parse import urlparse
+
+from . import download_progress, progress_lock
+from .config import (DOWNLOAD_FOLDER_PATH, PREFETCH_ENABLED, PREFETCH_BUDGET,
+                     PREFETCH_MAX_ACTIVE_JOBS, PREFETCH_TTL_SECONDS, RENDITION_MODE)
+from .utils import normalize_url
+from .download_manager import launch_download
+from .renditions import lookup as lookup_rendition
+
+# --- Speculative Prefetch ---
+# After /fetch_video_info the user spends a few seconds picking a format. If the
+# server is idle, start the format most often chosen on that platform; a matching
+# /start_download then attaches to the running job instead of starting over.
+
+# Fallback guesses until enough real choices have been recorded
+DEFAULT_ITAGS = {'youtube': 'mp4_720'}
+
+_lock = threading.Lock()
+_choices = defaultdict(Counter)  # platform -> Counter of itags picked in /start_download
+_offered = {}                    # platform -> itags offered by /fetch_video_info (choices outside it aren't counted)
+_speculative = {}                # (url, itag) -> {'download_id', 'cancel_event', 'claimed_event', 'timer'}
+_stats = Counter()               # started, hits, misses, mismatched, expired, preempted, skipped_*
+
+def platform_of(url):
+    """Groups URLs by site, e.g. 'youtube', 'tiktok.com'."""
+    host = (urlparse(url).hostname or '').lower()
+    if host.endswith('youtube.com') or host.endswith('youtu.be'):
+        return 'youtube'
+    return host[4:] if host.startswith('www.') else host
+
+def _key(url, itag):
+    normalized, _ = normalize_url(url)
+    return (normalized or url.strip(), itag)
+
+def _active_real_jobs():
+    speculative_ids = {entry['download_id'] for entry in _speculative.values()}
+    with progress_lock:
+        return sum(1 for dl_id, data in download_progress.items()
+                   if dl_id not in speculative_ids and data.get('status') not in ('complete', 'error'))
+
+def record_choice(url, itag):
+    """Counts a user's format choice (for a started job) towards that platform's prediction.
+
+    Only itags the platform has offered are counted, so arbitrary POSTs can't grow the table.
+    """
+    platform = platform_of(url)
+    with _lock:
+        if itag in _offered.get(platform, ()):
+            _choices[platform][itag] += 1
+
+def likely_itag(url, offered_itags):
+    """Most-chosen offered itag for the URL's platform (or a default guess)."""
+    platform = platform_of(url)
+    with _lock:
+        for itag, _ in _choices.get(platform, Counter()).most_common():
+            if itag in offered_itags:
+                return itag
+    guess = DEFAULT_ITAGS.get(platform, 'default')
+    return guess if guess in offered_itags else (offered_itags[0] if offered_itags else None)
+
+def maybe_prefetch(url, offered_itags):
+    """Starts a low-priority speculative job for the likely format, if capacity and budget allow."""
+    if not PREFETCH_ENABLED:
+        return None
+    with _lock:
+        _offered.setdefault(platform_of(url), set()).update(offered_itags)
+    itag = likely_itag(url, offered_itags)
+    if not itag:
+        return None
+    if RENDITION_MODE and lookup_rendition(url, itag):
+        _stats['skipped_rendition'] += 1 # /start_download will be served from the existing rendition
+        return None
+    key = _key(url, itag)
+    with _lock:
+        if key in _speculative:
+            return _speculative[key]['download_id'] # Already prefetching this one
+        if len(_speculative) >= PREFETCH_BUDGET:
+            _stats['skipped_budget'] += 1
+            return None
+        if _active_real_jobs() >= PREFETCH_MAX_ACTIVE_JOBS:
+            _stats['skipped_busy'] += 1
+            return None
+        cancel_event = threading.Event(); claimed_event = threading.Event()
+        # Always a dedicated thread: prefetch never takes an executor slot from a real job
+        download_id, error = launch_download(key[0], itag, cancel_event=cancel_event, low_priority=True, claimed_event=claimed_event)
+        if error:
+            _stats['skipped_storage'] += 1
+            return None
+        timer = threading.Timer(PREFETCH_TTL_SECONDS, _expire, args=(key, download_id))
+        timer.daemon = True
+        _speculative[key] = {'download_id': download_id, 'cancel_event': cancel_event, 'claimed_event': claimed_event, 'timer': timer}
+        _stats['started'] += 1
+    timer.start()
+    print(f"Prefetch: Speculatively started {download_id} for {key[0][:50]}..., Format: {itag}")
+    return download_id
+
+def claim(url, itag):
+    """Returns the download ID of a matching speculative job (now a real job), or None.
+
+    On a miss, speculative jobs for other formats of the same URL are cancelled.
+    """
+    key = _key(url, itag); stale = []; failed = False
+    with _lock:
+        entry = _speculative.pop(key, None)
+        if entry is None:
+            _stats['misses'] += 1
+            # The user picked another format: prefetches of this URL are certainly wasted
+            stale = [_speculative.pop(other) for other in [k for k in _speculative if k[0] == key[0]]]
+            _stats['mismatched'] += len(stale)
+        else:
+            with progress_lock:
+                failed = download_progress.get(entry['download_id'], {}).get('status') == 'error'
+            if failed:
+                _stats['misses'] += 1; _stats['failed'] += 1
+            else:
+                entry['timer'].cancel()
+                entry['claimed_event'].set() # Now a real job: it may take any free encode slot
+                _stats['hits'] += 1
+    for stale_entry in stale:
+        print(f"Prefetch: Cancelling speculative job {stale_entry['download_id']}, user chose Format: {itag}")
+        _cancel(stale_entry)
+    if entry is None:
+        return None
+    if failed:
+        _cancel(entry) # Let the real request retry from scratch
+        return None
+    print(f"Prefetch: Attached start_download to speculative job {entry['download_id']}")
+    return entry['download_id']
+
+def _cancel(entry):
+    """Stops a speculative job and removes whatever it produced."""
+    entry['timer'].cancel()
+    entry['cancel_event'].set()
+    download_id = entry['download_id']
+    with progress_lock:
+        finished = download_progress.get(download_id, {}).get('status') in ('complete', 'error')
+        if finished: download_progress.pop(download_id, None)
+    if finished:
+        # Its thread already exited and won't see the cancel, so clean up here
+        shutil.rmtree(os.path.join(DOWNLOAD_FOLDER_PATH, download_id), ignore_errors=True)
+    # Still running jobs delete their own files once they notice the cancel event
+
+def _expire(key, download_id):
+    with _lock:
+        entry = _speculative.get(key)
+        if entry is None or entry['download_id'] != download_id:
+            return # Claimed or already cancelled
+        del _speculative[key]
+        _stats['expired'] += 1
+    print(f"Prefetch: Speculative job {download_id} unclaimed after {PREFETCH_TTL_SECONDS}s, cancelling.")
+    _cancel(entry)
+
+def preempt_for_real_job():
+    """Cancels unclaimed, still running speculative jobs while real jobs fill the prefetch capacity.
+
+    Finished ones use no CPU or network, so they stay claimable until their TTL.
+    """
+    with _lock:
+        if not _speculative or _active_real_jobs() < PREFETCH_MAX_ACTIVE_JOBS:
+            return
+        with progress_lock:
+            running = [key for key, entry in _speculative.items()
+                       if download_progress.get(entry['download_id'], {}).get('status') not in ('complete', 'error')]
+        entries = [_speculative.pop(key) for key in running]
+        _stats['preempted'] += len(entries)
+    for entry in entries:
+        print(f"Prefetch: Preempting speculative job {entry['download_id']} for a real job.")
+        _cancel(entry)
+
+def prefetch_stats():
+    """Counters plus hit rate (claimed / started) and the current speculative jobs."""
+    with _lock:
+        stats = dict(_stats)
+        stats['in_flight'] = len(_speculative)
+        stats['hit_rate'] = round(_stats['hits'] / _stats['started'], 3) if _stats['started'] else None
+        stats['top_choices'] = {platform: counter.most_common(3) for platform, counter in _choices.items()}
+    return stats
@@ -0,0 +1,95 @@
+import os
+import time
+import uuid
+import shutil
+import threading
+
+from . import download_progress as shared_download_progress, progress_lock as shared_progress_lock
+from .config import DOWNLOAD_FOLDER_PATH
+from .utils import extract_video_id, YOUTUBE_RESOLUTIONS, MP3_BITRATES
+
+# --- Rendition Registry ---
+# (video_id, itag) -> download_id of a completed job holding that rendition.
+# Entries are validated on lookup, so expired/cleaned-up jobs simply drop out.
+
+_registry = {}
+_registry_lock = threading.Lock()
+
+def register(video_id, itag, download_id):
+    """Makes a completed job available for later requests of the same video and format."""
+    if video_id:
+        with _registry_lock:
+            _registry[(video_id, itag)] = download_id
+
+def lookup(url, itag):
+    """Returns the download ID of an existing rendition for url/itag, or None."""
+    video_id = extract_video_id(url)
+    if not video_id:
+        return None
+    with _registry_lock:
+        download_id = _registry.get((video_id, itag))
+    if not download_id:
+        return None
+    with shared_progress_lock:
+        entry = dict(shared_download_progress.get(download_id, {}))
+    usable = entry.get('status') == 'complete' and entry.get('filepath') and os.path.exists(entry['filepath']) # Stat outside the lock
+    if not usable:
+        with _registry_lock:
+            if _registry.get((video_id, itag)) == download_id: del _registry[(video_id, itag)]
+        return None
+    return download_id
+
+# --- Rendition Planning ---
+
+def plan_renditions(format_id, downloaded_info, title_stem, output_path_base=DOWNLOAD_FOLDER_PATH, has_audio=None):
+    """Lists the renditions to derive from a YouTube 'mp4_<height>' download.
+
+    Every offered resolution below both the requested one and the source's
+    actual height, plus each MP3 bitrate if the source has audio. Each gets
+    its own download ID and result directory so it can be served like any job.
+    """
+    if not format_id.startswith('mp4_') or not downloaded_info:
+        return []
+    try: requested = int(format_id.split('_')[1])
+    except (IndexError, ValueError): return []
+    source_height = downloaded_info.get('height') or requested
+    if has_audio is None: has_audio = downloaded_info.get('acodec') != 'none'
+
+    renditions = []
+    for height in sorted(YOUTUBE_RESOLUTIONS, reverse=True):
+        if height < min(requested, source_height):
+            renditions.append({'kind': 'video', 'height': height, 'itag': f'mp4_{height}', 'filename': f"{title_stem}_{height}p_quicktime.mp4"})
+    if has_audio:
+        for itag, bitrate in MP3_BITRATES.items():
+            renditions.append({'kind': 'audio', 'bitrate': bitrate, 'itag': itag, 'filename': f"{title_stem}_{bitrate}k.mp3"})
+
+    for rendition in renditions:
+        rendition['download_id'] = str(uuid.uuid4())
+        rendition_dir = os.path.join(output_path_base, rendition['download_id'])
+        os.makedirs(rendition_dir, exist_ok=True)
+        rendition['filepath'] = os.path.join(rendition_dir, rendition['filename'])
+        rendition['part_path'] = rendition['filepath'] + '.part'
+    return renditions
+
+def publish_renditions(video_id, renditions, source_download_id, download_progress=None, progress_lock=None):
+    """Moves encoded renditions into place and records them as completed jobs.
+
+    Only renditions recorded in the shared (web) progress dict are registered for reuse.
+    """
+    if download_progress is None: download_progress, progress_lock = shared_download_progress, shared_progress_lock
+    for rendition in renditions:
+        os.replace(rendition['part_path'], rendition['filepath']) # Atomic publish within the result volume
+        with progress_lock:
+            download_progress[rendition['download_id']] = {
+                'status': 'complete', 'progress': 100.0, 'filename': rendition['filename'],
+                'final_filename': rendition['filename'], 'filepath': rendition['filepath'], 'error': None,
+                'start_time': time.time(), '_download_phase': 5, 'info_text': 'Download complete!',
+                '_rendition_of': source_download_id
+            }
+        if download_progress is shared_download_progress: register(video_id, rendition['itag'], rendition['download_id'])
+    print(f"Renditions: Registered {len(renditions)} derived renditions of {video_id} from {source_download_id}.")
+
+def discard_renditions(renditions):
+    """Removes the directories of renditions whose encode failed."""
+    for rendition in renditions:
+        shutil.rmtree(os.path.dirname(rendition['filepath']), ignore_errors=True)
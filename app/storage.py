@@ -0,0 +1,76 @@
+import os
+import shutil
+import threading
+
+from .config import (SCRATCH_FOLDER_PATH, DOWNLOAD_FOLDER_PATH,
+                     JOB_SCRATCH_RESERVATION_BYTES, JOB_RESULT_RESERVATION_BYTES)
+
+# --- Storage Tiers ---
+# Scratch (SCRATCH_FOLDER_PATH) holds yt-dlp intermediates and merged sources.
+# Results (DOWNLOAD_FOLDER_PATH) holds the finished files served to users.
+
+# Bytes reserved per admitted job, keyed by download ID -> {device: bytes}
+_reservations = {}
+_reservation_lock = threading.Lock()
+
+def same_filesystem(path_a, path_b):
+    """True if both existing paths live on the same device (rename/link possible)."""
+    try:
+        return os.stat(path_a).st_dev == os.stat(path_b).st_dev
+    except OSError:
+        return False
+
+def _reserved_on_device(device):
+    return sum(per_job.get(device, 0) for per_job in _reservations.values())
+
+def admit_job(download_id):
+    """Reserves space for a job on both tiers. Returns (admitted, error)."""
+    tiers = [(SCRATCH_FOLDER_PATH, JOB_SCRATCH_RESERVATION_BYTES), (DOWNLOAD_FOLDER_PATH, JOB_RESULT_RESERVATION_BYTES)]
+    with _reservation_lock:
+        wanted = {}; tier_devices = []
+        for path, needed in tiers:
+            try:
+                device = os.stat(path).st_dev
+            except OSError as e:
+                return False, f"Storage unavailable: {e}"
+            tier_devices.append((path, device))
+            wanted[device] = wanted.get(device, 0) + needed
+        for path, device in tier_devices:
+            available = shutil.disk_usage(path).free - _reserved_on_device(device)
+            if available < wanted[device]:
+                print(f"Storage: Refusing job {download_id}, {available / 1024**2:.0f} MiB available on '{path}' but {wanted[device] / 1024**2:.0f} MiB needed.")
+                return False, 'Server is low on storage space. Please try again later.'
+        _reservations[download_id] = wanted
+    return True, None
+
+def release_job(download_id):
+    """Drops a job's reservation. Safe to call for jobs that were never admitted."""
+    with _reservation_lock:
+        _reservations.pop(download_id, None)
+
+def check_free_space(path, needed_bytes, download_id=None):
+    """Raises OSError if the volume holding path cannot fit needed_bytes.
+
+    The job's own reservation on that device counts towards the space it may use.
+    """
+    with _reservation_lock:
+        device = os.stat(path).st_dev
+        own = _reservations.get(download_id, {}).get(device, 0)
+        available = shutil.disk_usage(path).free - _reserved_on_device(device) + own
+    if available < needed_bytes:
+        raise OSError(f"Not enough space on result volume ({available / 1024**2:.0f} MiB free, {needed_bytes / 1024**2:.0f} MiB needed).")
+
+def publish_file(src_path, dst_path):
+    """Atomically moves a finished file into place and returns dst_path.
+
+    Same filesystem: a single os.replace (rename). Otherwise the file is
+    copied next to the destination and renamed, so readers never see a partial file.
+    """
+    if same_filesystem(os.path.dirname(src_path), os.path.dirname(dst_path)):
+        os.replace(src_path, dst_path)
+    else:
+        temp_path = dst_path + '.part'
+        shutil.copyfile(src_path, temp_path)
+        os.replace(temp_path, dst_path)
+        os.remove(src_path)
+    return dst_path
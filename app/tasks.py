@@ -1,15 +1,28 @@
 import os
 import time
 import shutil
+import threading
 import traceback
 
 # Import config and potentially shared state if needed
-from .config import CLEANUP_INTERVAL_SECONDS, CLEANUP_AGE_SECONDS
+from .config import CLEANUP_INTERVAL_SECONDS, CLEANUP_AGE_SECONDS, DOWNLOAD_FOLDER_PATH, SCRATCH_FOLDER_PATH
 
 # --- Cleanup Task ---
 
-def cleanup_old_downloads(download_folder_root, download_progress, progress_lock):
-    """Periodically cleans up old download directories."""
+def start_cleanup_thread(download_progress, progress_lock):
+    """Starts the cleanup thread for the web servers (once per process)."""
+    # Check if running in the main process (relevant for some WSGI servers/debug mode)
+    if os.environ.get('WERKZEUG_RUN_MAIN') == 'true': # Avoid starting thread twice in debug mode
+        print("Skipping background thread start in Werkzeug reloader process.")
+        return None
+    print("Starting cleanup thread...")
+    cleanup_thread = threading.Thread(target=cleanup_old_downloads, args=(DOWNLOAD_FOLDER_PATH, download_progress, progress_lock, SCRATCH_FOLDER_PATH), name="CleanupThread")
+    cleanup_thread.daemon = True
+    cleanup_thread.start()
+    return cleanup_thread
+
+def cleanup_old_downloads(download_folder_root, download_progress, progress_lock, scratch_folder_root=None):
+    """Periodically cleans up old download directories (and stale scratch directories)."""
     print(f"Cleanup thread started. Checking every {CLEANUP_INTERVAL_SECONDS / 60:.1f} minutes for items older than {CLEANUP_AGE_SECONDS / 3600:.1f} hours.")
     while True:
         try:
@@ -65,18 +78,32 @@ def cleanup_old_downloads(download_folder_root, download_progress, progress_lock
                     print(f"Cleanup Error: Failed to process item '{item_path}': {item_err}")
                     traceback.print_exc() # Print stack trace for unexpected errors
 
+            # --- Clean up stale scratch directories (left behind by crashed jobs) ---
+            if scratch_folder_root and os.path.abspath(scratch_folder_root) != os.path.abspath(download_folder_root) and os.path.exists(scratch_folder_root):
+                for item_name in os.listdir(scratch_folder_root):
+                    item_path = os.path.join(scratch_folder_root, item_name)
+                    try:
+                        if os.path.isdir(item_path) and len(item_name) == 36 and item_name not in active_dl_ids and os.path.getmtime(item_path) < cutoff_time:
+                            print(f"Cleanup: Removing stale scratch directory: {item_path}")
+                            shutil.rmtree(item_path)
+                            cleaned_dirs += 1
+                    except FileNotFoundError:
+                        continue
+                    except Exception as item_err:
+                        print(f"Cleanup Error: Failed to process scratch item '{item_path}': {item_err}")
+
             # --- Clean up orphaned entries in download_progress ---
             zombie_entries = []
             with progress_lock:
-                # Iterate over a copy of keys to allow modification during iteration
-                for dl_id in list(download_progress.keys()):
-                    # Check if the corresponding directory is missing
-                    expected_dir_path = os.path.join(download_folder_root, dl_id)
-                    if not os.path.exists(expected_dir_path):
-                        # Also check if the entry itself is old enough to be considered a zombie
-                        entry_start_time = download_progress[dl_id].get('start_time', 0)
-                        if entry_start_time < cutoff_time:
-                            zombie_entries.append(dl_id)
+                # Snapshot start times; the directory checks below run without holding the lock
+                entry_start_times = {dl_id: entry.get('start_time', 0) for dl_id, entry in download_progress.items()}
+            for dl_id, entry_start_time in entry_start_times.items():
+                # Check if the corresponding directory is missing
+                expected_dir_path = os.path.join(download_folder_root, dl_id)
+                if not os.path.exists(expected_dir_path):
+                    # Also check if the entry itself is old enough to be considered a zombie
+                    if entry_start_time < cutoff_time:
+                        zombie_entries.append(dl_id)
 
             if zombie_entries:
                  with progress_lock:
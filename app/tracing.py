@@ -0,0 +1,120 @@
+import io
+import time
+import uuid
+import hmac
+import marshal
+import pstats
+import cProfile
+import threading
+import functools
+from collections import deque
+
+from .config import TRACE_BUFFER_SIZE, ADMIN_TOKEN
+
+# --- Tracing Spans ---
+# Spans are plain dicts kept in a bounded ring buffer; the oldest fall off first.
+
+_spans = deque(maxlen=TRACE_BUFFER_SIZE)
+_spans_lock = threading.Lock()
+
+def record_span(trace_id, name, start, end, **attrs):
+    """Records a finished span. start/end are time.time() timestamps."""
+    if start is None or end is None:
+        return
+    span = {'trace_id': trace_id, 'name': name, 'start': start, 'end': end,
+            'duration': round(end - start, 4), 'thread': threading.current_thread().name, 'attrs': attrs}
+    with _spans_lock:
+        _spans.append(span)
+
+def traced(name):
+    """Decorator recording each call as a span under a fresh trace ID."""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            start = time.time()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                record_span(f"{name}-{uuid.uuid4().hex[:8]}", name, start, time.time(), args=repr(args)[:200])
+        return wrapper
+    return decorator
+
+def get_spans(trace_id=None):
+    """Returns a snapshot of buffered spans, optionally for one trace."""
+    with _spans_lock:
+        spans = list(_spans)
+    if trace_id:
+        spans = [span for span in spans if span['trace_id'] == trace_id]
+    return spans
+
+def to_chrome_trace(spans):
+    """Converts spans to Chrome trace JSON (chrome://tracing, Perfetto); one process row per trace."""
+    events = []; pids = {}; tids = {}
+    for span in spans:
+        if span['trace_id'] not in pids:
+            pids[span['trace_id']] = len(pids) + 1
+            events.append({'name': 'process_name', 'ph': 'M', 'pid': pids[span['trace_id']], 'args': {'name': span['trace_id']}})
+        tid = tids.setdefault(span['thread'], len(tids) + 1)
+        events.append({'name': span['name'], 'ph': 'X', 'pid': pids[span['trace_id']], 'tid': tid,
+                       'ts': int(span['start'] * 1e6), 'dur': int((span['end'] - span['start']) * 1e6), 'args': span['attrs']})
+    return {'traceEvents': events, 'displayTimeUnit': 'ms'}
+
+# --- On-Demand Job Profiling ---
+# Armed via the admin endpoint; the next N jobs each run under cProfile and
+# their stats are merged. On Python 3.12+ cProfile is process-wide and only one
+# profiler may run at a time, so concurrent jobs are skipped rather than nested.
+
+_profile_lock = threading.Lock()
+_profile_state = {'remaining': 0, 'jobs': [], 'stats': None}
+
+def arm_profiling(job_count):
+    """Profiles the next job_count jobs, discarding any previous results."""
+    with _profile_lock:
+        _profile_state.update({'remaining': max(0, int(job_count)), 'jobs': [], 'stats': None})
+
+def start_job_profile():
+    """Returns an enabled cProfile.Profile if profiling is armed, else None."""
+    with _profile_lock:
+        if _profile_state['remaining'] <= 0:
+            return None
+        profiler = cProfile.Profile()
+        try:
+            profiler.enable()
+        except ValueError:
+            return None # Another job is already being profiled
+        _profile_state['remaining'] -= 1
+    return profiler
+
+def finish_job_profile(profiler, job_id):
+    """Stops a profiler from start_job_profile and merges its stats."""
+    if profiler is None:
+        return
+    profiler.disable()
+    with _profile_lock:
+        if _profile_state['stats'] is None:
+            _profile_state['stats'] = pstats.Stats(profiler, stream=io.StringIO())
+        else:
+            _profile_state['stats'].add(profiler)
+        _profile_state['jobs'].append(job_id)
+
+def profile_report(limit=40):
+    """Returns profiling status plus the top functions by cumulative time as text."""
+    with _profile_lock:
+        report = {'remaining': _profile_state['remaining'], 'jobs': list(_profile_state['jobs']), 'profile': None}
+        if _profile_state['stats'] is not None:
+            stream = io.StringIO()
+            _profile_state['stats'].stream = stream
+            _profile_state['stats'].sort_stats('cumulative').print_stats(limit)
+            report['profile'] = stream.getvalue()
+    return report
+
+def profile_dump():
+    """Returns merged stats in the binary .prof format (for snakeviz/pstats), or None."""
+    with _profile_lock:
+        if _profile_state['stats'] is None:
+            return None
+        return marshal.dumps(_profile_state['stats'].stats)
+
+def is_admin(token):
+    """True if debug endpoints are enabled and token matches ADMIN_TOKEN."""
+    return bool(ADMIN_TOKEN) and bool(token) and hmac.compare_digest(token, ADMIN_TOKEN)
@@ -0,0 +1,172 @@
+import os
+import re
+import time
+import math
+import shutil
+import subprocess
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from .config import SEGMENTED_ENCODE_WORKERS, SEGMENTED_ENCODE_SEGMENTS_PER_WORKER
+from .tracing import record_span
+from .utils import parse_ffmpeg_time, JobCancelled
+
+# --- Shared Encode Settings ---
+# QuickTime-compatible H.264/AAC, used by both the single and segmented encode
+
+VIDEO_ENCODE_ARGS = ['-c:v', 'libx264', '-profile:v', 'high', '-level', '4.1', '-preset', 'fast', '-pix_fmt', 'yuv420p']
+AUDIO_ENCODE_ARGS = ['-c:a', 'aac', '-b:a', '192k']
+
+# --- FFmpeg Runner ---
+
+def run_ffmpeg(command, on_time=None, processes=None):
+    """Runs an FFmpeg command with -stats, calling on_time(seconds) as output time advances.
+
+    The Popen object is added to `processes` (if given) while running so a
+    supervisor can terminate it. Raises Exception if FFmpeg exits non-zero.
+    """
+    # Own session: a terminal Ctrl-C reaches only Python, which decides whether running encodes finish
+    process = subprocess.Popen(command, stderr=subprocess.PIPE, stdout=subprocess.DEVNULL, text=True, encoding='utf-8', errors='replace', bufsize=1, start_new_session=True)
+    if processes is not None: processes.append(process)
+    tail = []
+    try:
+        for line in process.stderr:
+            tail = (tail + [line])[-20:]
+            if on_time:
+                match = re.search(r"time=(\d{2}:\d{2}:\d{2}\.\d+)", line)
+                if match:
+                    seconds = parse_ffmpeg_time(match.group(1))
+                    if seconds is not None: on_time(seconds)
+        process.wait()
+    except BaseException:
+        # A callback raised (e.g. cancellation): don't leave FFmpeg running unsupervised
+        if process.poll() is None: process.terminate()
+        raise
+    finally:
+        if processes is not None and process in processes: processes.remove(process)
+    if process.returncode != 0:
+        print(f"!!! FFmpeg Error !!!\nCMD: {' '.join(command)}\nRC: {process.returncode}\nSTDERR: {''.join(tail)}\n!!! End FFmpeg Error !!!")
+        raise Exception(f"FFmpeg failed (code {process.returncode}).")
+
+def has_audio_stream(source_path):
+    """True if FFmpeg sees an audio stream in source_path.
+
+    Extractors don't always report acodec, so the file itself is checked
+    before building commands that map 0:a:0. Assumes audio if probing fails.
+    """
+    try:
+        result = subprocess.run(['ffmpeg', '-hide_banner', '-i', source_path], stderr=subprocess.PIPE, stdout=subprocess.DEVNULL,
+                                text=True, encoding='utf-8', errors='replace', timeout=30, start_new_session=True)
+    except (OSError, subprocess.TimeoutExpired) as e:
+        print(f"Warning: Could not probe streams of {source_path}: {e}")
+        return True
+    # Without an output file FFmpeg exits non-zero after printing the input's streams
+    if 'Stream #' not in result.stderr: return True
+    return re.search(r"Stream #\d+:\d+.*: Audio:", result.stderr) is not None
+
+# --- Segmented Parallel Encode ---
+
+def segmented_encode(source_path, output_path, total_duration, work_dir, progress_callback=None, has_audio=True, workers=None, trace_id=None, cancel_event=None):
+    """Encodes source_path to output_path by splitting it into keyframe-aligned chunks.
+
+    1. Stream-copy the video into ~equal segments (splits land on keyframes).
+    2. Encode the segments with up to `workers` FFmpeg processes in parallel,
+       while the audio track is encoded once, in full, alongside them
+       (per-segment audio would leave priming gaps at every boundary).
+    3. Concatenate the encoded segments losslessly and mux the audio with +faststart.
+
+    progress_callback(percent) receives progress aggregated across segments.
+    Setting cancel_event stops all encodes and raises JobCancelled.
+    Intermediate files are written under work_dir and removed afterwards.
+    """
+    workers = max(1, workers or SEGMENTED_ENCODE_WORKERS)
+    segment_count = workers * SEGMENTED_ENCODE_SEGMENTS_PER_WORKER
+    segment_seconds = max(10, math.ceil(total_duration / segment_count))
+    threads_per_encode = max(1, (os.cpu_count() or workers) // workers)
+    segment_dir = os.path.join(work_dir, 'segments')
+    os.makedirs(segment_dir, exist_ok=True)
+    processes = []
+
+    try:
+        # 1. Split (copy only, no re-encode). Matroska takes any codec the single encode accepts (VP8, FLV sources...)
+        split_start = time.time()
+        run_ffmpeg(['ffmpeg', '-v', 'quiet', '-stats', '-y', '-i', source_path, '-map', '0:v:0', '-c', 'copy',
+                    '-f', 'segment', '-segment_time', str(segment_seconds), '-reset_timestamps', '1',
+                    os.path.join(segment_dir, 'src_%04d.mkv')])
+        sources = sorted(f for f in os.listdir(segment_dir) if f.startswith('src_'))
+        record_span(trace_id, 'encode_split', split_start, time.time(), segments=len(sources), segment_seconds=segment_seconds)
+        if not sources:
+            raise Exception("FFmpeg split produced no segments.")
+        print(f"Segmented encode: {len(sources)} segments of ~{segment_seconds}s, {workers} workers x {threads_per_encode} threads.")
+
+        # 2. Parallel encodes; progress is the sum of encoded seconds over all segments
+        done_seconds = {}; progress_lock = threading.Lock()
+        def on_segment_time(name, seconds):
+            if cancel_event is not None and cancel_event.is_set(): raise JobCancelled("Encode cancelled.")
+            with progress_lock:
+                done_seconds[name] = seconds
+                percent = min(round(sum(done_seconds.values()) / total_duration * 100, 1), 99.9)
+            if progress_callback: progress_callback(percent)
+
+        def encode_segment(name):
+            start = time.time()
+            run_ffmpeg(['ffmpeg', '-v', 'quiet', '-stats', '-y', '-i', os.path.join(segment_dir, name), *VIDEO_ENCODE_ARGS,
+                        '-threads', str(threads_per_encode), '-an', os.path.join(segment_dir, 'enc_' + name[len('src_'):])],
+                       on_time=lambda seconds: on_segment_time(name, seconds), processes=processes)
+            record_span(trace_id, 'encode_segment', start, time.time(), segment=name)
+
+        def encode_audio():
+            start = time.time()
+            run_ffmpeg(['ffmpeg', '-v', 'quiet', '-stats', '-y', '-i', source_path, '-vn', '-map', '0:a:0', *AUDIO_ENCODE_ARGS,
+                        os.path.join(segment_dir, 'audio.m4a')], processes=processes)
+            record_span(trace_id, 'encode_audio', start, time.time())
+
+        encode_start = time.time()
+        with ThreadPoolExecutor(max_workers=workers + (1 if has_audio else 0), thread_name_prefix="SegmentEncode") as pool:
+            futures = [pool.submit(encode_segment, name) for name in sources]
+            if has_audio: futures.append(pool.submit(encode_audio))
+            try:
+                for future in futures: future.result()
+            except Exception:
+                # One failed encode fails the job; stop the rest instead of waiting for them
+                for future in futures: future.cancel()
+                for process in list(processes):
+                    if process.poll() is None: process.terminate()
+                raise
+        record_span(trace_id, 'encode_parallel', encode_start, time.time(), workers=workers)
+
+        # 3. Lossless concat + audio mux
+        concat_start = time.time()
+        list_path = os.path.join(segment_dir, 'concat.txt')
+        with open(list_path, 'w', encoding='utf-8') as list_file:
+            for name in sources: list_file.write(f"file 'enc_{name[len('src_'):]}'\n")
+        concat_command = ['ffmpeg', '-v', 'quiet', '-stats', '-y', '-f', 'concat', '-safe', '0', '-i', list_path]
+        if has_audio: concat_command += ['-i', os.path.join(segment_dir, 'audio.m4a'), '-map', '0:v:0', '-map', '1:a:0']
+        concat_command += ['-c', 'copy', '-movflags', '+faststart', '-f', 'mp4', output_path]
+        run_ffmpeg(concat_command)
+        record_span(trace_id, 'encode_concat', concat_start, time.time())
+    finally:
+        shutil.rmtree(segment_dir, ignore_errors=True)
+
+# --- Multi-Output Rendition Encode ---
+
+def encode_renditions(source_path, main_output_path, renditions, has_audio=True, on_time=None):
+    """Decodes source_path once and encodes the main output plus every rendition.
+
+    renditions: dicts with 'kind' ('video' with 'height', or 'audio' with
+    'bitrate'), and 'part_path' to write to. Video renditions share the main
+    output's encode settings and are scaled down from one split of the decoded frames.
+    """
+    video = [r for r in renditions if r['kind'] == 'video']
+    audio = [r for r in renditions if r['kind'] == 'audio'] if has_audio else []
+    filters = ["[0:v]split=%d[vmain]%s" % (len(video) + 1, ''.join(f"[vsrc{i}]" for i in range(len(video))))]
+    filters += [f"[vsrc{i}]scale=-2:{r['height']}[v{i}]" for i, r in enumerate(video)]
+    audio_args = ['-map', '0:a:0', *AUDIO_ENCODE_ARGS] if has_audio else []
+
+    command = ['ffmpeg', '-v', 'quiet', '-stats', '-y', '-i', source_path, '-filter_complex', ';'.join(filters)]
+    command += ['-map', '[vmain]', *VIDEO_ENCODE_ARGS, *audio_args, '-movflags', '+faststart', '-f', 'mp4', main_output_path]
+    for i, r in enumerate(video):
+        command += ['-map', f'[v{i}]', *VIDEO_ENCODE_ARGS, *audio_args, '-movflags', '+faststart', '-f', 'mp4', r['part_path']]
+    for r in audio:
+        command += ['-map', '0:a:0', '-c:a', 'libmp3lame', '-b:a', f"{r['bitrate']}k", '-f', 'mp3', r['part_path']]
+    run_ffmpeg(command, on_time=on_time)
@@ -5,9 +5,17 @@ from urllib.parse import parse_qs, urlparse
 import yt_dlp
 
 from .config import COMMON_HTTP_HEADERS
+from .tracing import traced
+
+# Formats offered for YouTube (itag 'mp4_<height>' / 'mp3_high' / 'mp3_medium')
+YOUTUBE_RESOLUTIONS = {1080: '1080p', 720: '720p', 480: '480p', 360: '360p'}
+MP3_BITRATES = {'mp3_high': '192', 'mp3_medium': '128'}
 
 # --- Helper Functions ---
 
+class JobCancelled(Exception):
+    """Raised inside a job when its cancel event is set (e.g. an expired prefetch)."""
+
 def extract_video_id(url):
     """Extract the video ID from a YouTube URL."""
     try:
@@ -21,6 +29,88 @@ def extract_video_id(url):
         pass
     return None
 
+def normalize_url(url):
+    """Validates a user-supplied URL, prefixing https:// for bare known domains.
+
+    Returns (url, error) where error is a user-facing message or None.
+    """
+    url = (url or '').strip()
+    if not url:
+        return None, 'URL cannot be empty'
+    if not re.match(r'^https?://', url, re.IGNORECASE):
+         # Allow common domains without schema, prefix with https
+         if re.match(r'^(www\.)?(youtu\.be/|youtube\.com/|tiktok\.com/|instagram\.com/|twitter\.com/|x\.com/)', url, re.IGNORECASE):
+              url = "https://" + url
+              print(f"Prefixed URL with https:// : {url}")
+         else:
+              # If it doesn't start with http/https AND isn't a recognized domain pattern
+              return None, 'Invalid URL format. Please include http:// or https://, or use a recognized domain.'
+    return url, None
+
+def info_error_status(error):
+    """Maps a get_video_info error message to an HTTP status code."""
+    # 400 for client-side errors (like invalid URL, private video), 500 for unexpected issues
+    return 400 if "Unsupported URL" in error or "private or unavailable" in error or "Could not extract" in error else 500
+
+def build_video_details(url, info):
+    """Builds the /fetch_video_info response payload from a yt-dlp info dict."""
+    # Extract details from the info dictionary
+    title = info.get('title', 'Unknown Title')
+    author = info.get('uploader', info.get('channel', 'Unknown Author')) # More fallbacks
+    duration = info.get('duration') # Keep as potentially None or 0
+    thumbnail = info.get('thumbnail')
+
+    # Attempt fallbacks for thumbnails on specific platforms if primary is missing
+    if not thumbnail:
+        print(f"Standard thumbnail missing for {url}. Attempting platform-specific fallbacks...")
+        # These fallbacks depend heavily on yt-dlp's current extraction logic
+        if 'tiktok.com' in url.lower():
+            thumbnail = info.get('url') # Sometimes the video URL itself works as preview
+            print(f"TikTok fallback thumbnail attempt -> info.get('url'): {thumbnail}")
+        elif 'instagram.com' in url.lower():
+            thumbnail = info.get('display_url') # Instagram often uses display_url
+            print(f"Instagram fallback thumbnail attempt -> info.get('display_url'): {thumbnail}")
+        # Add more platform-specific fallbacks if needed
+
+    # Prepare available format streams for the frontend
+    streams = []
+    # Check if it's a YouTube URL to offer specific resolutions
+    is_youtube = any(domain in url.lower() for domain in ['youtube.com', 'youtu.be'])
+
+    if is_youtube:
+        # Offer standard video resolutions for YouTube
+        streams.extend([
+            {'itag': f'mp4_{res_val}', 'quality': f'{res_label}', 'format': 'MP4', 'type': 'video'}
+            for res_val, res_label in YOUTUBE_RESOLUTIONS.items()
+        ])
+        # Offer standard MP3 audio options
+        streams.extend([
+            {'itag': 'mp3_high', 'quality': 'MP3 (192kbps)', 'format': 'MP3', 'type': 'audio'},
+            {'itag': 'mp3_medium', 'quality': 'MP3 (128kbps)', 'format': 'MP3', 'type': 'audio'}
+        ])
+    else:
+        # For other platforms, offer simpler options: Best Video (MP4) and MP3 Audio
+        streams.extend([
+            {'itag': 'default', 'quality': 'Best Available', 'format': 'MP4', 'type': 'video'},
+            {'itag': 'mp3_high', 'quality': 'MP3 (192kbps)', 'format': 'MP3', 'type': 'audio'}
+        ])
+
+    # Construct the response payload
+    video_details = {
+        'title': title,
+        'author': author,
+        'length': duration if isinstance(duration, (int, float)) and duration > 0 else 0, # Ensure numeric or 0
+        'thumbnail': thumbnail or '', # Ensure it's a string, even if empty
+        'streams': streams,
+        'video_id': info.get('id', 'unknown') # Include video ID if available
+    }
+
+    if not video_details['thumbnail']:
+         print(f"Warning: No thumbnail could be found for URL: {url}")
+
+    return video_details
+
+@traced('get_video_info')
 def get_video_info(url):
     """Get video info using yt-dlp without downloading."""
     try:
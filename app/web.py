@@ -0,0 +1,16 @@
+from flask import Flask
+
+# Import shared state before other app components
+from . import download_progress, progress_lock
+
+# Create the Flask App Instance
+app = Flask(__name__) # Will look for templates/static folders relative to here
+
+# --- Import other parts of the application ---
+# Import routes AFTER app instance is created and shared state is defined
+from . import routes
+# Import background tasks
+from . import tasks
+
+# --- Start Background Tasks ---
+tasks.start_cleanup_thread(download_progress, progress_lock)
@@ -0,0 +1,21 @@
+"""Production entry point: serves the app on an asyncio event loop (ASGI).
+
+Replaces the threaded Werkzeug dev server started by run.py. Run with:
+
+    hypercorn asgi:asgi_app --bind 0.0.0.0:8080
+
+Progress polls and file downloads are handled as coroutines, while yt-dlp and
+FFmpeg work runs on the bounded executors configured in app/config.py
+(ASYNC_INFO_WORKERS, ASYNC_DOWNLOAD_WORKERS).
+"""
+from app.asgi import asgi_app # Importing app.asgi also starts the cleanup thread
+
+if __name__ == '__main__':
+    import asyncio
+    from hypercorn.asyncio import serve
+    from hypercorn.config import Config
+
+    config = Config()
+    config.bind = ['0.0.0.0:8080']
+    print(" Starting Social Media Downloader (ASGI) at http://localhost:8080 ")
+    asyncio.run(serve(asgi_app, config))
@@ -0,0 +1,135 @@
+"""Connection scalability benchmark: threaded dev server vs. ASGI mode.
+
+Starts the server in the chosen mode, opens many concurrent keep-alive
+connections that poll /download_progress (like the browser does every 1.5s),
+plus a set of "slow" connections that stay open without reading, and reports
+throughput, latency percentiles and failed connections.
+
+    python bench_serving.py --mode threaded --pollers 1000 --slow 500
+    python bench_serving.py --mode asgi --pollers 1000 --slow 500
+"""
+import sys
+import time
+import socket
+import asyncio
+import argparse
+import subprocess
+
+SERVER_COMMANDS = {
+    'threaded': [sys.executable, '-c', "from app.web import app; app.run(host='127.0.0.1', port={port}, debug=False, threaded=True)"],
+    'asgi': [sys.executable, '-m', 'hypercorn', 'asgi:asgi_app', '--bind', '127.0.0.1:{port}'],
+}
+
+def start_server(mode, port):
+    """Launches the server in a subprocess and waits until it accepts connections."""
+    command = [part.format(port=port) for part in SERVER_COMMANDS[mode]]
+    process = subprocess.Popen(command, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    deadline = time.time() + 30
+    while time.time() < deadline:
+        try:
+            with socket.create_connection(('127.0.0.1', port), timeout=0.5):
+                return process
+        except OSError:
+            time.sleep(0.2)
+    process.kill()
+    raise RuntimeError(f"{mode} server did not start on port {port}")
+
+async def read_response(reader):
+    """Reads one HTTP/1.1 response, returning (status code, keep_alive)."""
+    status_line = await reader.readline()
+    if not status_line:
+        raise ConnectionError("connection closed")
+    content_length = 0; keep_alive = True
+    while True:
+        line = await reader.readline()
+        if line in (b'\r\n', b'\n', b''):
+            break
+        name, _, value = line.decode('latin-1').partition(':')
+        if name.strip().lower() == 'content-length':
+            content_length = int(value.strip())
+        elif name.strip().lower() == 'connection' and value.strip().lower() == 'close':
+            keep_alive = False
+    if content_length:
+        await reader.readexactly(content_length)
+    return int(status_line.split()[1]), keep_alive
+
+async def poller(port, duration, interval, stats):
+    """Polls the progress endpoint until the deadline, reusing the connection when allowed."""
+    request = (f"GET /download_progress/bench-00000000 HTTP/1.1\r\nHost: 127.0.0.1:{port}\r\n\r\n").encode()
+    deadline = time.monotonic() + duration
+    writer = None
+    while time.monotonic() < deadline:
+        sent = time.monotonic() # Latency includes reconnecting when the server closed the connection
+        try:
+            if writer is None:
+                reader, writer = await asyncio.wait_for(asyncio.open_connection('127.0.0.1', port), timeout=10)
+        except Exception:
+            stats['connect_failures'] += 1
+            await asyncio.sleep(interval)
+            continue
+        try:
+            writer.write(request)
+            await writer.drain()
+            _, keep_alive = await asyncio.wait_for(read_response(reader), timeout=10)
+            stats['latencies'].append(time.monotonic() - sent)
+        except Exception:
+            stats['request_failures'] += 1
+            keep_alive = False
+        if not keep_alive:
+            writer.close(); writer = None
+        await asyncio.sleep(interval)
+    if writer is not None:
+        writer.close()
+
+async def slow_client(port, duration, stats):
+    """Opens a connection, sends a partial request and idles, like a stalled mobile client."""
+    try:
+        reader, writer = await asyncio.wait_for(asyncio.open_connection('127.0.0.1', port), timeout=10)
+        writer.write(f"GET /download_progress/bench-slow HTTP/1.1\r\nHost: 127.0.0.1:{port}\r\n".encode())
+        await writer.drain()
+        await asyncio.sleep(duration)
+        writer.close()
+    except Exception:
+        stats['connect_failures'] += 1
+
+async def run_load(port, pollers, slow, duration, interval):
+    stats = {'latencies': [], 'connect_failures': 0, 'request_failures': 0}
+    tasks = [slow_client(port, duration, stats) for _ in range(slow)]
+    tasks += [poller(port, duration, interval, stats) for _ in range(pollers)]
+    await asyncio.gather(*tasks)
+    return stats
+
+def percentile(values, pct):
+    if not values:
+        return float('nan')
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--mode', choices=sorted(SERVER_COMMANDS), default='asgi')
+    parser.add_argument('--port', type=int, default=8099)
+    parser.add_argument('--pollers', type=int, default=500, help='Concurrent keep-alive progress pollers')
+    parser.add_argument('--slow', type=int, default=200, help='Concurrent idle slow-client connections')
+    parser.add_argument('--duration', type=float, default=20.0, help='Seconds to hold the load')
+    parser.add_argument('--interval', type=float, default=1.5, help='Seconds between polls per connection')
+    args = parser.parse_args()
+
+    server = start_server(args.mode, args.port)
+    try:
+        started = time.monotonic()
+        stats = asyncio.run(run_load(args.port, args.pollers, args.slow, args.duration, args.interval))
+        elapsed = time.monotonic() - started
+    finally:
+        server.terminate()
+        server.wait(timeout=10)
+
+    latencies_ms = [value * 1000 for value in stats['latencies']]
+    print(f"mode={args.mode} pollers={args.pollers} slow={args.slow} duration={args.duration:.0f}s")
+    print(f"  completed requests : {len(latencies_ms)} ({len(latencies_ms) / elapsed:.1f} req/s)")
+    print(f"  latency p50/p99/max: {percentile(latencies_ms, 50):.1f} / {percentile(latencies_ms, 99):.1f} / {max(latencies_ms, default=float('nan')):.1f} ms")
+    print(f"  connect failures   : {stats['connect_failures']}")
+    print(f"  request failures   : {stats['request_failures']}")
+
+if __name__ == '__main__':
+    main()
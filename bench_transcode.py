@@ -0,0 +1,81 @@
+"""Wall-clock benchmark: single-process encode vs. segmented parallel encode.
+
+Generates a synthetic 1080p test source (or uses --source), then encodes it
+with the same FFmpeg settings as download_thread, once as a single process
+and once with app.transcode.segmented_encode, and prints the speedup.
+
+    python bench_transcode.py --duration 600 --workers 4
+"""
+import os
+import re
+import sys
+import time
+import shutil
+import argparse
+import tempfile
+import subprocess
+
+from app.transcode import VIDEO_ENCODE_ARGS, AUDIO_ENCODE_ARGS, run_ffmpeg, segmented_encode, has_audio_stream
+from app.utils import parse_ffmpeg_time
+from app.config import SEGMENTED_ENCODE_WORKERS
+
+def make_source(path, duration):
+    """Creates an H.264/AAC test clip with moving content and 2s keyframe spacing."""
+    run_ffmpeg(['ffmpeg', '-v', 'quiet', '-stats', '-y',
+                '-f', 'lavfi', '-i', f'testsrc2=size=1920x1080:rate=30:duration={duration}',
+                '-f', 'lavfi', '-i', f'sine=frequency=440:sample_rate=48000:duration={duration}',
+                '-c:v', 'libx264', '-preset', 'ultrafast', '-g', '60', '-c:a', 'aac', '-shortest', path])
+
+def probe_duration(path):
+    """Length of path in seconds via ffprobe (or FFmpeg's input summary if ffprobe is missing)."""
+    if shutil.which('ffprobe'):
+        result = subprocess.run(['ffprobe', '-v', 'error', '-show_entries', 'format=duration', '-of', 'default=noprint_wrappers=1:nokey=1', path],
+                                stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True)
+        try: return float(result.stdout.strip())
+        except ValueError: pass
+    result = subprocess.run(['ffmpeg', '-hide_banner', '-i', path], stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True, errors='replace')
+    match = re.search(r"Duration: (\d{2}:\d{2}:\d{2}\.\d+)", result.stderr)
+    return parse_ffmpeg_time(match.group(1)) if match else None
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--source', help='Existing media file to encode (default: generate a test clip)')
+    parser.add_argument('--duration', type=int, default=300, help='Seconds of test clip to generate (ignored with --source)')
+    parser.add_argument('--workers', type=int, default=SEGMENTED_ENCODE_WORKERS, help='Parallel FFmpeg segment encodes')
+    args = parser.parse_args()
+
+    work_dir = tempfile.mkdtemp(prefix='bench_transcode_')
+    try:
+        source = args.source
+        duration = args.duration
+        if not source:
+            source = os.path.join(work_dir, 'source.mp4')
+            print(f"Generating {duration}s 1080p test source...")
+            make_source(source, duration)
+        else:
+            # Segment count and progress depend on the real length, as in production
+            duration = probe_duration(source)
+            if not duration:
+                print(f"Could not determine the duration of {source}.", file=sys.stderr)
+                return 1
+            print(f"Source {source}: {duration:.1f}s")
+
+        single_out = os.path.join(work_dir, 'single.mp4')
+        started = time.monotonic()
+        run_ffmpeg(['ffmpeg', '-v', 'quiet', '-stats', '-y', '-i', source, *VIDEO_ENCODE_ARGS, *AUDIO_ENCODE_ARGS, '-movflags', '+faststart', single_out])
+        single_seconds = time.monotonic() - started
+        print(f"single-process encode : {single_seconds:.1f}s")
+
+        segmented_out = os.path.join(work_dir, 'segmented.mp4')
+        started = time.monotonic()
+        segmented_encode(source, segmented_out, duration, work_dir, has_audio=has_audio_stream(source), workers=args.workers)
+        segmented_seconds = time.monotonic() - started
+        print(f"segmented encode ({args.workers}w): {segmented_seconds:.1f}s")
+
+        print(f"speedup               : {single_seconds / segmented_seconds:.2f}x")
+        print(f"output sizes          : {os.path.getsize(single_out) / 1024**2:.1f} MiB vs {os.path.getsize(segmented_out) / 1024**2:.1f} MiB")
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,187 @@
+"""Headless bulk ingest: runs URLs through the download pipeline without the web app.
+
+Reads one URL per line (optionally followed by a format ID such as mp4_720 or
+mp3_high) from a file or stdin, downloads/encodes them in parallel with the same
+download_thread pipeline the web app uses, moves finished files into the output
+directory and appends one JSON line per item to a manifest. Items already in the
+manifest are skipped, so an interrupted run can simply be started again.
+
+    python ingest.py urls.txt --output-dir backfill --download-workers 4 --encode-workers 2
+    cat urls.txt | python ingest.py - --output-dir backfill --format mp3_high
+"""
+import os
+import sys
+import json
+import time
+import uuid
+import shutil
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from app.download_manager import download_thread, set_encode_concurrency
+from app.utils import get_video_info, normalize_url
+from app.storage import publish_file
+from app.tracing import get_spans
+
+def read_items(source, default_format):
+    """Yields (url, format_id) pairs, skipping blank lines and # comments."""
+    for line in source:
+        line = line.strip()
+        if not line or line.startswith('#'):
+            continue
+        parts = line.split()
+        yield parts[0], (parts[1] if len(parts) > 1 else default_format)
+
+def load_manifest(manifest_path, retry_failed):
+    """Returns the (url, format) pairs already recorded and not to be redone."""
+    done = set()
+    if not os.path.exists(manifest_path):
+        return done
+    with open(manifest_path, encoding='utf-8') as manifest_file:
+        for line in manifest_file:
+            try: record = json.loads(line)
+            except ValueError: continue # Tolerate a truncated last line from an interrupted run
+            if retry_failed and record.get('status') != 'complete':
+                continue
+            done.add((record.get('input_url'), record.get('format')))
+    return done
+
+def reserve_target(output_dir, filename, download_id):
+    """Atomically claims an unused path in output_dir for filename.
+
+    The empty placeholder (O_CREAT|O_EXCL) keeps concurrent workers finishing
+    items with the same name from overwriting each other; publish_file replaces it.
+    """
+    stem, ext = os.path.splitext(filename)
+    candidates = [filename, f"{stem} [{download_id[:8]}]{ext}"]
+    attempt = 2
+    while True:
+        name = candidates.pop(0) if candidates else f"{stem} [{download_id[:8]}-{attempt}]{ext}"
+        target = os.path.join(output_dir, name)
+        try:
+            os.close(os.open(target, os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+            return target
+        except FileExistsError:
+            if not candidates: attempt += 1
+
+def collect_output(entry, job_dir, output_dir, download_id):
+    """Moves a finished file out of its per-job directory into output_dir."""
+    filename = entry.get('final_filename') or os.path.basename(entry['filepath'])
+    target = reserve_target(output_dir, filename, download_id)
+    try:
+        publish_file(entry['filepath'], target)
+    except OSError:
+        try: os.remove(target) # Drop the placeholder so the name isn't left taken by an empty file
+        except OSError: pass
+        raise
+    try: os.rmdir(job_dir)
+    except OSError: pass
+    return target
+
+def stage_timings(download_id):
+    """Sums this job's tracing spans by stage name."""
+    timings = {}
+    for span in get_spans(download_id):
+        timings[span['name']] = round(timings.get(span['name'], 0) + span['duration'], 3)
+    return timings
+
+def ingest_item(input_url, format_id, args, jobs_dir, scratch_dir):
+    """Runs one item through the pipeline and returns its manifest record."""
+    download_id = str(uuid.uuid4())
+    record = {'input_url': input_url, 'format': format_id, 'download_id': download_id, 'status': 'error',
+              'output': None, 'renditions': [], 'title': None, 'error': None,
+              'started_at': time.strftime('%Y-%m-%dT%H:%M:%S'), 'elapsed_seconds': None, 'stages': {}}
+    started = time.time()
+    url, error = normalize_url(input_url)
+    if not error and args.probe:
+        info, error = get_video_info(url)
+        if info: record['title'] = info.get('title')
+    if error:
+        record.update({'error': error, 'elapsed_seconds': round(time.time() - started, 3)})
+        return record
+
+    # A private progress dict per item: the pipeline reports into it instead of the web app's state
+    progress = {}; lock = threading.Lock()
+    download_thread(url, format_id, jobs_dir, download_id, started, download_progress=progress, progress_lock=lock, scratch_path_base=scratch_dir)
+
+    entry = progress.get(download_id, {})
+    record['status'] = entry.get('status', 'error')
+    record['error'] = entry.get('error')
+    if record['status'] == 'complete':
+        try:
+            record['output'] = collect_output(entry, os.path.join(jobs_dir, download_id), args.output_dir, download_id)
+            # Renditions derived from this download (RENDITION_MODE) are collected too
+            for rendition_id, rendition in progress.items():
+                if rendition.get('_rendition_of') == download_id:
+                    record['renditions'].append(collect_output(rendition, os.path.join(jobs_dir, rendition_id), args.output_dir, rendition_id))
+        except OSError as move_err:
+            record.update({'status': 'error', 'error': f"Could not move output: {move_err}"})
+    if record['status'] != 'complete':
+        shutil.rmtree(os.path.join(jobs_dir, download_id), ignore_errors=True) # No cleanup thread runs here
+    record['elapsed_seconds'] = round(time.time() - started, 3)
+    record['stages'] = stage_timings(download_id)
+    return record
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('input', nargs='?', default='-', help="File with one URL per line, or '-' for stdin (default)")
+    parser.add_argument('--output-dir', required=True, help='Directory for finished files')
+    parser.add_argument('--manifest', help='JSONL manifest path (default: <output-dir>/manifest.jsonl)')
+    parser.add_argument('--format', default='default', help="Format ID for lines without one (e.g. mp4_720, mp3_high; default: 'default')")
+    parser.add_argument('--download-workers', type=int, default=4, help='Items processed concurrently')
+    parser.add_argument('--encode-workers', type=int, default=2, help='FFmpeg encodes running at once (0 = unlimited)')
+    parser.add_argument('--scratch-dir', help='Directory for intermediates (default: <output-dir>/.scratch)')
+    parser.add_argument('--probe', action='store_true', help='Fetch video info first to record titles and skip unsupported URLs early')
+    parser.add_argument('--retry-failed', action='store_true', help='Re-run items recorded as failed in the manifest')
+    args = parser.parse_args()
+
+    args.output_dir = os.path.abspath(args.output_dir)
+    manifest_path = args.manifest or os.path.join(args.output_dir, 'manifest.jsonl')
+    jobs_dir = os.path.join(args.output_dir, '.jobs') # Per-item working dirs; finished files are moved out
+    scratch_dir = os.path.abspath(args.scratch_dir or os.path.join(args.output_dir, '.scratch'))
+    for folder in (args.output_dir, jobs_dir, scratch_dir):
+        os.makedirs(folder, exist_ok=True)
+
+    if args.input == '-':
+        items = list(read_items(sys.stdin, args.format))
+    else:
+        with open(args.input, encoding='utf-8') as input_file:
+            items = list(read_items(input_file, args.format))
+    done = load_manifest(manifest_path, args.retry_failed)
+    pending = list(dict.fromkeys(item for item in items if item not in done)) # De-duplicate, keep order
+    print(f"Ingest: {len(items)} items, {len(items) - len(pending)} already in manifest, {len(pending)} to process.", file=sys.stderr)
+
+    set_encode_concurrency(args.encode_workers)
+    manifest_lock = threading.Lock(); counts = {'complete': 0, 'error': 0}; interrupted = threading.Event()
+    with open(manifest_path, 'a', encoding='utf-8') as manifest_file:
+        def run(item):
+            record = ingest_item(item[0], item[1], args, jobs_dir, scratch_dir)
+            if interrupted.is_set() and record['status'] != 'complete':
+                # Likely killed by the interrupt (yt-dlp's merger FFmpeg shares our process group): retry next run
+                print(f"Ingest: not recording {item[0]} (failed after interrupt), it will be retried.", file=sys.stderr)
+                return
+            with manifest_lock:
+                manifest_file.write(json.dumps(record) + '\n'); manifest_file.flush()
+                counts['complete' if record['status'] == 'complete' else 'error'] += 1
+                print(f"Ingest [{sum(counts.values())}/{len(pending)}] {record['status']}: {item[0]} ({record['elapsed_seconds']}s) {record['output'] or record['error']}", file=sys.stderr)
+
+        pool = ThreadPoolExecutor(max_workers=max(1, args.download_workers), thread_name_prefix="IngestWorker")
+        futures = [pool.submit(run, item) for item in pending]
+        try:
+            for future in futures:
+                future.result()
+        except KeyboardInterrupt:
+            interrupted.set()
+            # Drop the queued backlog; in-flight items finish (completed ones are recorded), the rest resume next run
+            print("Ingest interrupted: finishing in-flight items, skipping the rest. Re-run to resume.", file=sys.stderr)
+            pool.shutdown(wait=True, cancel_futures=True)
+            print(f"Ingest stopped: {counts['complete']} complete, {counts['error']} failed. Manifest: {manifest_path}", file=sys.stderr)
+            return 130
+        pool.shutdown()
+
+    print(f"Ingest finished: {counts['complete']} complete, {counts['error']} failed. Manifest: {manifest_path}", file=sys.stderr)
+    return 0 if counts['error'] == 0 else 1
+
+if __name__ == '__main__':
+    sys.exit(main())
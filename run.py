@@ -1,13 +1,14 @@
 import os
 import threading
-from app import app, tasks # Import the app instance and tasks module
-from app.config import DOWNLOAD_FOLDER # Import config for printing
+from app.web import app # Import the app instance (also starts the cleanup thread)
+from app.config import DOWNLOAD_FOLDER_PATH, SCRATCH_FOLDER_PATH # Import config for printing
 
 if __name__ == '__main__':
-    # Cleanup thread is started in app/__init__.py
+    # Cleanup thread is started in app/web.py
     print("-----------------------------------------------------")
     print(" Starting Social Media Downloader Flask App ")
-    print(f" Downloads in: {os.path.abspath(DOWNLOAD_FOLDER)}")
+    print(f" Downloads in: {os.path.abspath(DOWNLOAD_FOLDER_PATH)}")
+    print(f" Scratch in:   {os.path.abspath(SCRATCH_FOLDER_PATH)}")
     print(f" Cleanup after 2 hours.")
     print(" Ensure FFmpeg is in PATH.")
     print(" Ensure yt-dlp is updated (`pip install -U yt-dlp`).")
@@ -15,9 +16,7 @@ if __name__ == '__main__':
     print("-----------------------------------------------------")
 
     # Use app.run() for development/simple deployment.
-    # For production, consider a WSGI server like Gunicorn or Waitress.
-    # Example using Waitress (if installed: pip install waitress):
-    # from waitress import serve
-    # serve(app, host='0.0.0.0', port=8080)
+    # For production, use the async entry point instead:
+    #   hypercorn asgi:asgi_app --bind 0.0.0.0:8080
 
     app.run(host='0.0.0.0', port=8080, debug=False, threaded=True)